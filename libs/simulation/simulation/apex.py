@@ -0,0 +1,328 @@
+"""Ape-X style DQN (Horgan et al., 2018): actor processes feed a learner.
+
+Every actor process steps its own `CartPoleVectorEnv` with a local copy of the
+`QNet` and writes the transitions into a `SharedReplayBuffer`. The learner, in
+the main process, samples from that buffer, takes the gradient steps of a
+`DQNAgent` and publishes its weights through `SharedWeights`, which the actors
+pull every `sync_every` steps. Acting and learning overlap, and acting scales
+with the number of actor processes.
+
+Run with `uv run python -m simulation.apex`.
+"""
+
+import multiprocessing as mp
+import queue
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+import torch
+
+from simulation.dqn import METRICS_DIR, DQNAgent, ReplayBuffer
+
+
+class SharedReplayBuffer(ReplayBuffer):
+    """`ReplayBuffer` whose fields, cursor and size live in shared memory.
+
+    It is passed to processes started from `ctx`, which attach to the same
+    memory. The lock that adding and sampling hold is shared by all processes,
+    so batches never contain half-written transitions. The process that created the buffer
+    owns the memory and frees it in `close`.
+    """
+
+    def __init__(self, buffer_size, batch_size, state_shape, ctx=mp):
+        # The cursor and size are shared as well, `ReplayBuffer` only sees properties
+        self._counters_memory = shared_memory.SharedMemory(create=True, size=16)
+        self._counters = np.ndarray(2, dtype=np.int64, buffer=self._counters_memory.buf)
+        super().__init__(buffer_size, batch_size)
+        self._lock = ctx.Lock()  # in place of the thread lock of `ReplayBuffer`
+        self._owner = True
+
+        self._memories = {}
+        self._allocate(state_shape)
+
+    def _allocate(self, state_shape):
+        for name, dtype in self.FIELDS.items():
+            shape = self._field_shape(name, state_shape)
+            size = int(np.prod(shape)) * np.dtype(dtype).itemsize
+            memory = shared_memory.SharedMemory(create=True, size=size)
+            self._memories[name] = memory
+            setattr(self, name, np.ndarray(shape, dtype=dtype, buffer=memory.buf))
+
+    @property
+    def cursor(self):
+        return int(self._counters[0])
+
+    @cursor.setter
+    def cursor(self, value):
+        self._counters[0] = value
+
+    @property
+    def size(self):
+        return int(self._counters[1])
+
+    @size.setter
+    def size(self, value):
+        self._counters[1] = value
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        for name in (*self.FIELDS, "_counters", "_counters_memory", "_memories"):
+            del state[name]
+        state["_owner"] = False
+        state["_names"] = {name: memory.name for name, memory in self._memories.items()}
+        state["_names"]["_counters"] = self._counters_memory.name
+        state["_shapes"] = {name: getattr(self, name).shape for name in self.FIELDS}
+        state["_dtypes"] = {name: getattr(self, name).dtype for name in self.FIELDS}
+        return state
+
+    def __setstate__(self, state):
+        names = state.pop("_names")
+        shapes = state.pop("_shapes")
+        dtypes = state.pop("_dtypes")
+        self.__dict__.update(state)
+
+        self._counters_memory = shared_memory.SharedMemory(names["_counters"])
+        self._counters = np.ndarray(2, dtype=np.int64, buffer=self._counters_memory.buf)
+        self._memories = {}
+        for name in self.FIELDS:
+            memory = shared_memory.SharedMemory(names[name])
+            self._memories[name] = memory
+            setattr(
+                self,
+                name,
+                np.ndarray(shapes[name], dtype=dtypes[name], buffer=memory.buf),
+            )
+
+    def close(self):
+        # The arrays must not outlive the memory they view
+        for name in (*self.FIELDS, "_counters"):
+            setattr(self, name, None)
+        for memory in (*self._memories.values(), self._counters_memory):
+            memory.close()
+            if self._owner:
+                memory.unlink()
+
+
+class SharedWeights:
+    """The parameters of a module in shared memory, with a version counter.
+
+    The learner `publish`es its parameters, and actors `pull` them into their
+    own copy of the module when the version has changed.
+    """
+
+    def __init__(self, module, ctx=mp):
+        self.numel = sum(param.numel() for param in module.parameters())
+        self._memory = shared_memory.SharedMemory(create=True, size=4 * self.numel)
+        self._lock = ctx.Lock()
+        self.version = ctx.Value("q", 0, lock=False)
+        self._owner = True
+
+    @property
+    def vector(self):
+        return torch.frombuffer(self._memory.buf, dtype=torch.float32)
+
+    def publish(self, module):
+        with self._lock, torch.no_grad():
+            offset = 0
+            vector = self.vector
+            for param in module.parameters():
+                n = param.numel()
+                vector[offset : offset + n] = param.view(-1)
+                offset += n
+            self.version.value += 1
+
+    def pull(self, module, version):
+        """Copy the weights into `module` if newer than `version`, and return the
+        version of the weights `module` now has."""
+        if self.version.value == version:
+            return version
+        with self._lock, torch.no_grad():
+            offset = 0
+            vector = self.vector
+            for param in module.parameters():
+                n = param.numel()
+                # In place, so that inference views of the parameters stay valid
+                param.view(-1).copy_(vector[offset : offset + n])
+                offset += n
+            return self.version.value
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_memory"] = self._memory.name
+        state["_owner"] = False
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._memory = shared_memory.SharedMemory(self._memory)
+
+    def close(self):
+        self._memory.close()
+        if self._owner:
+            self._memory.unlink()
+
+
+def actor_epsilons(num_actors, epsilon=0.4, alpha=7.0):
+    """Per-actor exploration rates `epsilon ** (1 + alpha * i / (N - 1))` of Ape-X."""
+    if num_actors == 1:
+        return [epsilon]
+    return [epsilon ** (1 + alpha * i / (num_actors - 1)) for i in range(num_actors)]
+
+
+def _act(
+    replay_buffer,
+    weights,
+    stop,
+    env_steps,
+    episodes,
+    num_envs,
+    epsilon,
+    sync_every,
+    seed,
+):
+    """Actor process: steps `num_envs` envs until `stop` is set."""
+    from simulation.envs.cartpole import CartPoleVectorEnv
+
+    torch.set_num_threads(1)
+    np.random.seed(seed)
+    # Exit without waiting for the learner to drain the episode queue
+    episodes.cancel_join_thread()
+
+    agent = DQNAgent(replay_buffer=replay_buffer)
+    agent.epsilon = epsilon
+    version = weights.pull(agent.qnet, -1)
+
+    env = CartPoleVectorEnv(num_envs=num_envs, inplace=True)
+    obs_, _ = env.reset(seed=seed)
+    obs = obs_.copy()
+    total_reward = np.zeros(num_envs)
+    was_done = np.zeros(num_envs, dtype=np.bool_)
+
+    step = 0
+    while not stop.is_set():
+        actions = agent.get_actions(obs)
+        next_obs, rewards, terminated, truncated, info = env.step(actions)
+
+        # Skip the transitions from the final observations to the reset ones
+        valid = ~was_done
+        replay_buffer.add_batch(
+            obs[valid],
+            actions[valid],
+            rewards[valid],
+            next_obs[valid],
+            terminated[valid],
+        )
+        np.copyto(obs, next_obs)
+        total_reward += rewards
+
+        done = terminated | truncated
+        for episode_reward in total_reward[done]:
+            episodes.put(float(episode_reward))
+        total_reward[done] = 0.0
+        np.copyto(was_done, done)
+
+        with env_steps.get_lock():
+            env_steps.value += num_envs
+        step += 1
+        if step % sync_every == 0:
+            version = weights.pull(agent.qnet, version)
+
+    env.close()
+
+
+def train(
+    num_actors=4,
+    envs_per_actor=16,
+    num_updates=20_000,
+    sync_every=50,
+    publish_interval=100,
+    sync_interval=500,
+):
+    """Run `num_actors` actor processes and learn from them for `num_updates` steps.
+
+    Args:
+        num_actors: Number of actor processes, each with its own exploration rate
+        envs_per_actor: Envs stepped together by every actor
+        num_updates: Gradient steps of the learner
+        sync_every: Actor steps between checks for new weights
+        publish_interval: Gradient steps between publishing the weights to actors
+        sync_interval: Gradient steps between syncs of the target network
+    """
+    from simulation.metrics import MetricsRecorder, plot
+
+    ctx = mp.get_context("spawn")
+    torch.set_num_threads(1)
+
+    replay_buffer = SharedReplayBuffer(10_000, 32, (4,), ctx)
+    agent = DQNAgent(replay_buffer=replay_buffer)
+    weights = SharedWeights(agent.qnet, ctx)
+    weights.publish(agent.qnet)
+
+    stop = ctx.Event()
+    env_steps = ctx.Value("q", 0)
+    episodes = ctx.Queue()
+    actors = [
+        ctx.Process(
+            target=_act,
+            args=(
+                replay_buffer,
+                weights,
+                stop,
+                env_steps,
+                episodes,
+                envs_per_actor,
+                epsilon,
+                sync_every,
+                seed,
+            ),
+            daemon=True,
+        )
+        for seed, epsilon in enumerate(actor_epsilons(num_actors))
+    ]
+    for actor in actors:
+        actor.start()
+
+    episode_metrics = MetricsRecorder(f"{METRICS_DIR}/dqn_apex_episodes.parquet")
+    num_episodes = 0
+    try:
+        while len(replay_buffer) < agent.batch_size:
+            time.sleep(0.01)
+
+        start = time.perf_counter()
+        for update in range(1, num_updates + 1):
+            agent.learn()
+            if update % publish_interval == 0:
+                weights.publish(agent.qnet)
+            if update % sync_interval == 0:
+                agent.sync_qnet()
+
+            while True:
+                try:
+                    reward = episodes.get_nowait()
+                except queue.Empty:
+                    break
+                episode_metrics.log(episode=num_episodes, reward=reward)
+                num_episodes += 1
+
+            if update % 1000 == 0:
+                elapsed = time.perf_counter() - start
+                print(
+                    f"update: {update}, episodes: {num_episodes},"
+                    f" env steps/s: {env_steps.value / elapsed:,.0f},"
+                    f" updates/s: {update / elapsed:,.0f}"
+                )
+    finally:
+        stop.set()
+        for actor in actors:
+            actor.join()
+        episodes.close()
+        episode_metrics.close()
+        replay_buffer.close()
+        weights.close()
+
+    plot(episode_metrics.path, x="episode", y="reward")
+
+
+if __name__ == "__main__":
+    train()
@@ -0,0 +1,13 @@
+import time
+from typing import Callable
+
+
+def usec_per_call(fn: Callable[[], object], min_time: float = 0.2) -> float:
+    """Mean time of `fn()` in microseconds, over calls for at least `min_time` seconds."""
+    fn()  # warm up
+    calls = 0
+    start = time.perf_counter()
+    while (elapsed := time.perf_counter() - start) < min_time:
+        fn()
+        calls += 1
+    return elapsed / calls * 1e6
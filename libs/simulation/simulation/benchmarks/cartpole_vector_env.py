@@ -0,0 +1,68 @@
+"""Steps/sec of `CartPoleVectorEnv` for the default and in-place stepping modes,
+for in-place `step_n` rollouts and for the thread-sharded mode.
+
+Run with `uv run python -m simulation.benchmarks.cartpole_vector_env`.
+"""
+
+import os
+import time
+
+import numpy as np
+
+from simulation.envs.cartpole import CartPoleVectorEnv
+
+
+def steps_per_sec(env: CartPoleVectorEnv, num_steps: int = 200) -> float:
+    env.reset(seed=0)
+    actions = np.random.default_rng(0).integers(0, 2, size=(num_steps, env.num_envs))
+
+    start = time.perf_counter()
+    for action in actions:
+        env.step(action)
+    elapsed = time.perf_counter() - start
+
+    return num_steps * env.num_envs / elapsed
+
+
+def step_n_steps_per_sec(env: CartPoleVectorEnv, num_steps: int = 200) -> float:
+    env.reset(seed=0)
+    actions = np.random.default_rng(0).integers(0, 2, size=(num_steps, env.num_envs))
+    env.step_n(actions)  # allocate the output buffers
+
+    start = time.perf_counter()
+    env.step_n(actions)
+    elapsed = time.perf_counter() - start
+
+    return num_steps * env.num_envs / elapsed
+
+
+def main():
+    for num_envs in [10, 100, 1_000, 10_000, 100_000, 1_000_000]:
+        num_steps = max(20, 2_000_000 // num_envs)
+        default = steps_per_sec(CartPoleVectorEnv(num_envs), num_steps)
+        inplace = steps_per_sec(CartPoleVectorEnv(num_envs, inplace=True), num_steps)
+        step_n = step_n_steps_per_sec(
+            CartPoleVectorEnv(num_envs, inplace=True), num_steps
+        )
+        print(
+            f"num_envs={num_envs:>9,}  default={default:>14,.0f} steps/s"
+            f"  inplace={inplace:>14,.0f} steps/s  ({inplace / default:.2f}x)"
+            f"  step_n={step_n:>14,.0f} steps/s  ({step_n / default:.2f}x)"
+        )
+
+    num_envs = 1_000_000
+    single = steps_per_sec(CartPoleVectorEnv(num_envs, inplace=True), 20)
+    for num_threads in sorted({1, 2, 4, os.cpu_count() or 1}):
+        env = CartPoleVectorEnv(
+            num_envs, inplace=True, shard_size=65_536, num_threads=num_threads
+        )
+        sharded = steps_per_sec(env, 20)
+        env.close()
+        print(
+            f"num_envs={num_envs:>9,}  num_threads={num_threads:>3}"
+            f"  sharded={sharded:>14,.0f} steps/s  ({sharded / single:.2f}x)"
+        )
+
+
+if __name__ == "__main__":
+    main()
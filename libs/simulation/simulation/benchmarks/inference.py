@@ -0,0 +1,56 @@
+"""Latency of `QNet` and `PolicyNetwork` inference on the CPU, for batch sizes 1
+to 4096: eager PyTorch with and without autograd, a frozen TorchScript trace and
+the `NumpyMLP` path returned by `inference()`.
+
+Run with `uv run python -m simulation.benchmarks.inference`.
+"""
+
+import numpy as np
+import torch
+
+from simulation.benchmarks import usec_per_call
+from simulation.cartpole import PolicyNetwork
+from simulation.dqn import QNet
+
+
+def compare(name: str, net: torch.nn.Module, obs_dims: int) -> None:
+    net.eval()
+    numpy_net = net.inference()
+    frozen = torch.jit.freeze(torch.jit.trace(net, torch.zeros(1, obs_dims)))
+
+    def no_grad(x):
+        with torch.no_grad():
+            return net(x)
+
+    def script(x):
+        with torch.inference_mode():
+            return frozen(x)
+
+    for batch_size in [1, 4, 16, 64, 256, 1024, 4096]:
+        obs = np.random.default_rng(0).standard_normal((batch_size, obs_dims))
+        obs = obs.astype(np.float32)
+        x = torch.from_numpy(obs)
+
+        eager = usec_per_call(lambda: net(x))
+        timings = {
+            "no_grad": usec_per_call(lambda: no_grad(x)),
+            "jit": usec_per_call(lambda: script(x)),
+            "numpy": usec_per_call(lambda: numpy_net(obs)),
+        }
+        print(
+            f"{name:<14} batch={batch_size:>5}  eager={eager:>8.1f}us"
+            + "".join(
+                f"  {mode}={t:>8.1f}us ({eager / t:.1f}x)"
+                for mode, t in timings.items()
+            )
+        )
+
+
+def main():
+    torch.manual_seed(0)
+    compare("QNet", QNet(2), 4)
+    compare("PolicyNetwork", PolicyNetwork(4, 1), 4)
+
+
+if __name__ == "__main__":
+    main()
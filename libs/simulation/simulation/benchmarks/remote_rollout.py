@@ -0,0 +1,80 @@
+"""Transitions/sec per `RolloutWorker` streaming to a `RolloutServer` on
+127.0.0.1, for CartPole-v99 and the MuJoCo InvertedPendulum-v4.
+
+The learner side only drains the received batches, so this measures the workers
+and the transport. Run with `uv run python -m simulation.benchmarks.remote_rollout`.
+"""
+
+import multiprocessing as mp
+import queue
+import time
+
+from simulation.remote import RolloutServer, RolloutWorker, make_policy
+
+
+def _work(address, env_id, num_envs, seed):
+    RolloutWorker(address, env_id, num_envs, seed=seed).run()
+
+
+def transitions_per_sec(
+    env_id: str, num_workers: int, num_envs: int, duration: float = 5.0
+) -> list[float]:
+    import gymnasium as gym
+
+    import simulation.envs  # noqa: F401 (registers CartPole-v99)
+
+    env = gym.make(env_id)
+    server = RolloutServer(
+        ("127.0.0.1", 0), make_policy(env.observation_space, env.action_space)
+    )
+    env.close()
+    server.start()
+
+    ctx = mp.get_context("spawn")
+    workers = [
+        ctx.Process(
+            target=_work,
+            args=(server.server_address, env_id, num_envs, seed),
+            daemon=True,
+        )
+        for seed in range(num_workers)
+    ]
+    for worker in workers:
+        worker.start()
+
+    # Measure once every worker has connected and sent a first batch
+    while len(server.received) < num_workers or not all(server.received.values()):
+        server.transitions.get()
+    start_counts = dict(server.received)
+    start = time.perf_counter()
+    while time.perf_counter() - start < duration:
+        try:
+            server.transitions.get(timeout=0.1)
+        except queue.Empty:
+            pass
+    elapsed = time.perf_counter() - start
+    counts = dict(server.received)
+
+    server.stop()
+    for worker in workers:
+        worker.terminate()
+        worker.join()
+
+    return [
+        (counts[address] - start_counts[address]) / elapsed for address in start_counts
+    ]
+
+
+def main():
+    for env_id, num_envs in [("CartPole-v99", 256), ("InvertedPendulum-v4", 16)]:
+        for num_workers in [1, 2]:
+            rates = transitions_per_sec(env_id, num_workers, num_envs)
+            print(
+                f"{env_id:<20} num_envs={num_envs:>4} workers={num_workers}"
+                f"  total={sum(rates):>12,.0f} transitions/s"
+                f"  per worker={', '.join(f'{rate:,.0f}' for rate in rates)}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""Time of the `simulation.returns` kernels against the Python loops they replace,
+for one long episode and for batched `(T, N)` rollouts.
+
+Run with `uv run python -m simulation.benchmarks.returns`.
+"""
+
+import numpy as np
+import torch
+
+from simulation.benchmarks import usec_per_call
+from simulation.returns import discounted_returns, gae, nstep_targets
+
+
+def insert_loop(rewards: np.ndarray, gamma: float) -> list:
+    """The loop `REINFORCE.update` used, one episode at a time."""
+    running_g = 0
+    gs: list[float] = []
+    for R in rewards[::-1]:
+        running_g = R + gamma * running_g
+        gs.insert(0, running_g)
+    return gs
+
+
+def backward_loop(
+    rewards: np.ndarray, gamma: float, terminated: np.ndarray
+) -> np.ndarray:
+    """One vectorized step per time step."""
+    returns = np.empty_like(rewards)
+    running_g = np.zeros(rewards.shape[1:])
+    for t in range(len(rewards) - 1, -1, -1):
+        running_g = rewards[t] + gamma * ~terminated[t] * running_g
+        returns[t] = running_g
+    return returns
+
+
+def gae_loop(rewards, values, next_values, terminated, gamma, lam):
+    advantages = np.empty_like(rewards)
+    running = np.zeros(rewards.shape[1:])
+    for t in range(len(rewards) - 1, -1, -1):
+        delta = rewards[t] + gamma * ~terminated[t] * next_values[t] - values[t]
+        running = delta + gamma * lam * ~terminated[t] * running
+        advantages[t] = running
+    return advantages
+
+
+def main():
+    gamma, lam = 0.99, 0.95
+    rng = np.random.default_rng(0)
+    for length, num_envs in [(1_000, 1), (10_000, 1), (1_000, 16), (256, 1024)]:
+        shape = (length, num_envs)
+        rewards = rng.standard_normal(shape)
+        terminated = rng.random(shape) < 0.01
+        values = rng.standard_normal(shape)
+        next_values = rng.standard_normal(shape)
+        t_rewards, t_terminated = (
+            torch.from_numpy(rewards),
+            torch.from_numpy(terminated),
+        )
+        t_values, t_next_values = (
+            torch.from_numpy(values),
+            torch.from_numpy(next_values),
+        )
+
+        timings = {}
+        if num_envs == 1:
+            timings["insert loop"] = usec_per_call(
+                lambda: insert_loop(rewards[:, 0], gamma)
+            )
+        timings["backward loop"] = usec_per_call(
+            lambda: backward_loop(rewards, gamma, terminated)
+        )
+        timings["returns numpy"] = usec_per_call(
+            lambda: discounted_returns(rewards, gamma, terminated)
+        )
+        timings["returns torch"] = usec_per_call(
+            lambda: discounted_returns(t_rewards, gamma, t_terminated)
+        )
+        timings["gae loop"] = usec_per_call(
+            lambda: gae_loop(rewards, values, next_values, terminated, gamma, lam)
+        )
+        timings["gae numpy"] = usec_per_call(
+            lambda: gae(rewards, values, next_values, gamma, lam, terminated)
+        )
+        timings["gae torch"] = usec_per_call(
+            lambda: gae(t_rewards, t_values, t_next_values, gamma, lam, t_terminated)
+        )
+        timings["5-step numpy"] = usec_per_call(
+            lambda: nstep_targets(rewards, next_values, gamma, 5, terminated)
+        )
+
+        print(f"T={length:>6,} N={num_envs:>5,}")
+        for name, usec in timings.items():
+            print(f"  {name:<14} {usec:>10.1f}us")
+
+
+if __name__ == "__main__":
+    main()
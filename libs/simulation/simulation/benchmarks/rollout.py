@@ -0,0 +1,60 @@
+"""Throughput of batched open-loop rollouts of `models/humanoid.xml`: a serial
+`mj_step` loop on one `MjData`, and `RolloutEngine` with its Python thread pool
+and with `mujoco.rollout`.
+
+Run with `uv run python -m simulation.benchmarks.rollout`.
+"""
+
+import os
+import time
+
+import mujoco
+import numpy as np
+
+from simulation.rollout import STATE_SPEC, RolloutEngine, get_state
+
+MODEL_PATH = f"{os.path.dirname(__file__)}/../models/humanoid.xml"
+
+
+def serial(model, initial_state, controls):
+    data = mujoco.MjData(model)
+    for rollout_controls in controls:
+        mujoco.mj_resetData(model, data)
+        mujoco.mj_setState(model, data, initial_state, STATE_SPEC)
+        for ctrl in rollout_controls:
+            data.ctrl[:] = ctrl
+            mujoco.mj_step(model, data)
+
+
+def main(num_rollouts=64, num_steps=500):
+    model = mujoco.MjModel.from_xml_path(MODEL_PATH)
+    data = mujoco.MjData(model)
+    mujoco.mj_forward(model, data)
+    initial_state = get_state(model, data)
+
+    low, high = model.actuator_ctrlrange.T
+    controls = np.random.default_rng(0).uniform(
+        low, high, (num_rollouts, num_steps, model.nu)
+    )
+    num_env_steps = num_rollouts * num_steps
+
+    start = time.perf_counter()
+    serial(model, initial_state, controls)
+    baseline = time.perf_counter() - start
+    print(f"serial             {num_env_steps / baseline:>10,.0f} steps/s")
+
+    for backend in ["threads", "mujoco"]:
+        for num_threads in sorted({1, os.cpu_count() or 1}):
+            with RolloutEngine(model, num_threads, backend) as engine:
+                engine.rollout(initial_state, controls[:, :1])  # warm up
+                start = time.perf_counter()
+                engine.rollout(initial_state, controls)
+                elapsed = time.perf_counter() - start
+            print(
+                f"{backend:<8} threads={num_threads:<3}"
+                f" {num_env_steps / elapsed:>10,.0f} steps/s ({baseline / elapsed:.2f}x)"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -2,21 +2,20 @@
 
 import math
 import os
-import pickle
+import queue
 import random
-import time
+from typing import Callable, Optional
 
-import altair as alt
 import gymnasium as gym
-import mujoco
-import mujoco.viewer
 import numpy as np
-import polars as pl
 import torch
 import torch.nn as nn
 from torch.distributions.normal import Normal
 
-alt.renderers.enable("browser")
+from simulation.inference import NumpyMLP
+from simulation.returns import discounted_returns
+
+METRICS_DIR = f"{os.path.dirname(__file__)}/../data/metrics"
 
 
 class PolicyNetwork(nn.Module):
@@ -75,6 +74,33 @@ class PolicyNetwork(nn.Module):
 
         return action_means, action_stddevs
 
+    def inference(
+        self, max_batch_size: int = 1
+    ) -> Callable[[np.ndarray], tuple[np.ndarray, np.ndarray]]:
+        """Autograd-free NumPy evaluator of `forward` that tracks the weights of
+        this network.
+
+        Args:
+            max_batch_size: Batch size the buffers are allocated for
+
+        Returns:
+            A function of `(B, obs_space_dims)` observations that returns the means
+             and standard deviations as buffers that its next call overwrites
+        """
+        shared_net = NumpyMLP(
+            [self.shared_net[0], self.shared_net[2]], ["tanh", "tanh"], max_batch_size
+        )
+        policy_mean_net = NumpyMLP([self.policy_mean_net[0]], [None], max_batch_size)
+        policy_stddev_net = NumpyMLP(
+            [self.policy_stddev_net[0]], ["softplus"], max_batch_size
+        )
+
+        def forward(x: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+            shared_features = shared_net(x)
+            return policy_mean_net(shared_features), policy_stddev_net(shared_features)
+
+        return forward
+
 
 class REINFORCE:
     """REINFORCE algorithm."""
@@ -92,10 +118,14 @@ class REINFORCE:
         self.gamma = 0.99  # Discount factor
         self.eps = 1e-6  # small number for mathematical stability
 
-        self.probs = []  # Stores probability values of the sampled action
-        self.rewards = []  # Stores the corresponding rewards
+        # The observations actions were sampled for, the sampled actions and
+        # the corresponding rewards
+        self.states: list[np.ndarray] = []
+        self.actions: list[np.ndarray] = []
+        self.rewards: list[float] = []
 
         self.net = PolicyNetwork(obs_space_dims, action_space_dims)
+        self.net_inference = self.net.inference()
         self.optimizer = torch.optim.AdamW(
             self.net.parameters(),
             lr=self.learning_rate,
@@ -110,47 +140,90 @@ class REINFORCE:
         Returns:
             action: Action to be performed
         """
-        state = torch.tensor(np.array([state]))
-        action_means, action_stddevs = self.net(state)
+        action_means, action_stddevs = self.net_inference(state[np.newaxis])
 
-        # create a normal distribution from the predicted
-        #   mean and standard deviation and sample an action
-        distrib = Normal(action_means[0] + self.eps, action_stddevs[0] + self.eps)
-        action = distrib.sample()
-        prob = distrib.log_prob(action)
+        # sample an action from the normal distribution with the predicted
+        #   mean and standard deviation. Its log probability is computed with
+        #   autograd in `update`, for the whole episode at once.
+        action = np.random.normal(
+            action_means[0] + self.eps, action_stddevs[0] + self.eps
+        ).astype(np.float32)
 
-        action = action.numpy()
-
-        self.probs.append(prob)
+        self.states.append(state)
+        self.actions.append(action)
 
         return action
 
+    def sample_actions(self, states: np.ndarray) -> np.ndarray:
+        """Returns one action per env for `(N, obs_space_dims)` observations,
+        without storing them like `sample_action`.
+
+        Args:
+            states: Observations from a vector environment
+
+        Returns:
+            actions: Actions of shape `(N, action_space_dims)`
+        """
+        action_means, action_stddevs = self.net_inference(states)
+        return np.random.normal(action_means + self.eps, action_stddevs + self.eps)
+
     def update(self):
         """Updates the policy network's weights."""
-        running_g = 0
-        gs = []
+        self._update(
+            np.array(self.states)[:, np.newaxis],
+            np.array(self.actions)[:, np.newaxis],
+            discounted_returns(np.array(self.rewards), self.gamma)[:, np.newaxis],
+        )
 
-        # Discounted return (backwards) - [::-1] will return an array in reverse
-        for R in self.rewards[::-1]:
-            running_g = R + self.gamma * running_g
-            gs.insert(0, running_g)
+        # Empty / zero out all episode-centric/related variables
+        self.states = []
+        self.actions = []
+        self.rewards = []
 
-        deltas = torch.tensor(gs)
+    def update_batch(
+        self,
+        states: np.ndarray,
+        actions: np.ndarray,
+        rewards: np.ndarray,
+        mask: np.ndarray,
+    ):
+        """Updates the policy network's weights from `N` episodes collected together.
 
-        loss = 0
-        # minimize -1 * prob * reward obtained
-        for log_prob, delta in zip(self.probs, deltas):
-            loss += log_prob.mean() * delta * (-1)
+        Args:
+            states: Observations of shape `(T, N, obs_space_dims)`
+            actions: Actions of shape `(T, N, action_space_dims)`
+            rewards: Rewards of shape `(T, N)`
+            mask: Whether each step belongs to the episode of its env, of shape `(T, N)`
+        """
+        returns = discounted_returns(np.where(mask, rewards, 0.0), self.gamma)
+        self._update(states, actions, returns, mask)
+
+    def _update(
+        self,
+        states: np.ndarray,
+        actions: np.ndarray,
+        returns: np.ndarray,
+        mask: Optional[np.ndarray] = None,
+    ):
+        """Take a gradient step on `(T, N)` steps of `N` episodes, evaluating all the
+        log probabilities in a single forward pass."""
+        deltas = torch.from_numpy(returns)
+        if mask is not None:
+            deltas = deltas * torch.from_numpy(mask)
+
+        action_means, action_stddevs = self.net(torch.from_numpy(states))
+        distrib = Normal(action_means + self.eps, action_stddevs + self.eps)
+        log_probs = distrib.log_prob(torch.from_numpy(actions))
+
+        # minimize -1 * prob * reward obtained, summed over the steps of an
+        #   episode and averaged over the episodes
+        loss = (log_probs.mean(-1) * deltas * (-1)).sum() / deltas.shape[1]
 
         # Update the policy network
         self.optimizer.zero_grad()
         loss.backward()
         self.optimizer.step()
 
-        # Empty / zero out all episode-centric/related variables
-        self.probs = []
-        self.rewards = []
-
 
 def infer():
     env = gym.make("Acrobot-v1", render_mode="human")
@@ -168,30 +241,176 @@ def infer():
     env.close()
 
 
-def train():
-    env = gym.make("InvertedPendulum-v5", render_mode="human")
+class PolicyEvaluator:
+    """Renders or records rollouts of snapshots of a policy in its own process.
+
+    Training `submit`s snapshots of its `PolicyNetwork` without ever waiting: when
+    the evaluator is still busy with the previous snapshot, the new one is
+    dropped. The evaluation process runs `num_episodes` episodes per snapshot
+    with the mean action. With `render_mode="rgb_array"` the episodes are
+    recorded to `video_folder`, with `"human"` they are shown in a window.
+
+    Args:
+        obs_space_dims: Dimension of the observation space
+        action_space_dims: Dimension of the action space
+        env_id: The env to evaluate in
+        render_mode: Render mode of the evaluation env
+        num_episodes: Episodes per snapshot
+        video_folder: Where recorded episodes are written
+    """
+
+    def __init__(
+        self,
+        obs_space_dims: int,
+        action_space_dims: int,
+        env_id: str = "InvertedPendulum-v4",
+        render_mode: Optional[str] = "rgb_array",
+        num_episodes: int = 1,
+        video_folder: str = f"{os.path.dirname(__file__)}/../videos",
+    ):
+        import multiprocessing as mp
+
+        ctx = mp.get_context("spawn")
+        # A manager queue can be handed to pool workers, unlike a plain one
+        self._manager = ctx.Manager()
+        self.snapshots = self._manager.Queue(maxsize=1)
+        self.process = ctx.Process(
+            target=_evaluate,
+            args=(
+                self.snapshots,
+                obs_space_dims,
+                action_space_dims,
+                env_id,
+                render_mode,
+                num_episodes,
+                video_folder,
+            ),
+        )
+        self.process.start()
+
+    def submit(self, episode: int, net: PolicyNetwork) -> bool:
+        return submit_snapshot(self.snapshots, episode, net)
+
+    def close(self):
+        """Wait for the evaluation of the last snapshot and stop the process."""
+        while self.process.is_alive():
+            try:
+                self.snapshots.put(None, timeout=0.1)
+                break
+            except queue.Full:
+                pass
+        self.process.join()
+        self._manager.shutdown()
+
+
+def submit_snapshot(snapshots, episode: int, net: PolicyNetwork) -> bool:
+    """Offer a copy of the weights of `net` to a `PolicyEvaluator` queue.
+
+    Returns:
+        Whether the snapshot was taken, `False` while the evaluator is busy
+    """
+    state_dict = {
+        name: tensor.detach().numpy().copy()
+        for name, tensor in net.state_dict().items()
+    }
+    try:
+        snapshots.put_nowait((episode, state_dict))
+    except queue.Full:
+        return False
+    return True
+
+
+def _evaluate(
+    snapshots,
+    obs_space_dims: int,
+    action_space_dims: int,
+    env_id: str,
+    render_mode: Optional[str],
+    num_episodes: int,
+    video_folder: str,
+):
+    """Evaluation process of `PolicyEvaluator`."""
+    torch.set_num_threads(1)
+    if render_mode == "rgb_array" and "DISPLAY" not in os.environ:
+        # Offscreen MuJoCo rendering on a headless machine
+        os.environ.setdefault("MUJOCO_GL", "egl")
+
+    env = gym.make(env_id, render_mode=render_mode)
+    if render_mode == "rgb_array":
+        env = gym.wrappers.RecordVideo(
+            env, video_folder, episode_trigger=lambda _: True, name_prefix="eval"
+        )
+    net = PolicyNetwork(obs_space_dims, action_space_dims)
+    net_inference = net.inference()
+
+    while (snapshot := snapshots.get()) is not None:
+        episode, state_dict = snapshot
+        net.load_state_dict(
+            {name: torch.from_numpy(array) for name, array in state_dict.items()}
+        )
+
+        for _ in range(num_episodes):
+            obs, info = env.reset()
+            total_reward = 0.0
+            done = False
+            while not done:
+                action_means, _ = net_inference(obs[np.newaxis])
+                obs, reward, terminated, truncated, info = env.step(action_means[0])
+                total_reward += float(reward)
+                done = terminated or truncated
+            print("Evaluation at episode:", episode, "Reward:", total_reward)
+
+    env.close()
+
+
+def train_seed(
+    seed: int,
+    results_dir: str,
+    total_num_episodes: int = 5_000,
+    num_threads: int = 1,
+    env_id: str = "InvertedPendulum-v4",
+    snapshots=None,
+    eval_every: Optional[int] = None,
+) -> str:
+    """Train REINFORCE with one seed, streaming the return of every episode to
+    `results_dir/seed=<seed>.parquet`.
+
+    Args:
+        seed: Seed of torch, random, NumPy and the env
+        results_dir: Directory of the results files of a sweep
+        total_num_episodes: Total number of episodes
+        num_threads: Threads of torch intra-op parallelism
+        env_id: The MuJoCo env to train on
+        snapshots: Queue of a `PolicyEvaluator` to offer the policy to
+        eval_every: Episodes between snapshots offered to `snapshots`, which
+            is required when set
+
+    Returns:
+        The path of the results file
+    """
+    from simulation.metrics import MetricsRecorder
+
+    torch.set_num_threads(num_threads)
+
+    env = gym.make(env_id)
     wrapped_env = gym.wrappers.RecordEpisodeStatistics(
         env, 50
     )  # Records episode-reward
 
-    total_num_episodes = int(5e3)  # Total number of episodes
     # Observation-space of InvertedPendulum-v4 (4)
-    obs_space_dims = env.observation_space.shape[0]
+    obs_space_dims = gym.spaces.flatdim(env.observation_space)
     # Action-space of InvertedPendulum-v4 (1)
-    action_space_dims = env.action_space.shape[0]
-    rewards_over_seeds: list[list] = []
+    action_space_dims = gym.spaces.flatdim(env.action_space)
 
-    # for seed in [1]:
-    for seed in [1, 2, 3, 5, 8]:  # Fibonacci seeds
-        # set seed
-        torch.manual_seed(seed)
-        random.seed(seed)
-        np.random.seed(seed)
+    # set seed
+    torch.manual_seed(seed)
+    random.seed(seed)
+    np.random.seed(seed)
 
-        # Reinitialize agent every seed
-        agent = REINFORCE(obs_space_dims, action_space_dims)
-        reward_over_episodes = []
+    agent = REINFORCE(obs_space_dims, action_space_dims)
+    path = f"{results_dir}/seed={seed}.parquet"
 
+    with MetricsRecorder(path, batch_size=1_000) as metrics:
         for episode in range(total_num_episodes):
             # gymnasium v26 requires users to set seed while resetting the environment
             obs, info = wrapped_env.reset(seed=seed)
@@ -212,27 +431,231 @@ def train():
                 #  - terminated: Any of the state space values is no longer finite.
                 done = terminated or truncated
 
-            reward_over_episodes.append(wrapped_env.return_queue[-1])
+            metrics.log(
+                seed=seed, episode=episode, reward=float(wrapped_env.return_queue[-1])
+            )
             agent.update()
+            if eval_every and episode % eval_every == 0:
+                submit_snapshot(snapshots, episode, agent.net)
 
             if episode % 1000 == 0:
                 avg_reward = int(np.mean(wrapped_env.return_queue))
-                print("Episode:", episode, "Average Reward:", avg_reward)
+                print("Seed:", seed, "Episode:", episode, "Average Reward:", avg_reward)
+
+    env.close()
+    return path
+
 
-        rewards_over_seeds.append(reward_over_episodes)
+def _student_t_quantile(q: float, df: int, num_points: int = 100_001) -> float:
+    """Quantile `q >= 0.5` of Student's t distribution with `df` degrees of freedom.
 
-    with open("rewards_over_seeds.pickle", "wb") as f:
-        pickle.dump(rewards_over_seeds, f)
+    With `t = sqrt(df) * tan(theta)` the density of `theta` on `[0, pi/2)` is
+    proportional to `cos(theta) ** (df - 1)`, which is integrated numerically.
+    """
+    theta = np.linspace(0.0, np.pi / 2, num_points)
+    density = np.cos(theta) ** (df - 1)
+    cdf = np.concatenate([[0.0], np.cumsum(density[1:] + density[:-1])])
+    cdf /= cdf[-1]
+    return math.sqrt(df) * math.tan(np.interp(2 * q - 1, cdf, theta))
+
+
+def summarize_seeds(results_dir: str, confidence: float = 0.95):
+    """Mean return per episode over the seeds of a sweep, with a Student-t
+    confidence band for `num_seeds - 1` degrees of freedom, written to
+    `results_dir/summary.parquet`."""
+    import polars as pl
+
+    summary = (
+        pl.scan_parquet(f"{results_dir}/seed=*.parquet")
+        .group_by("episode")
+        .agg(
+            pl.col("reward").mean().alias("mean"),
+            pl.col("reward").std().fill_null(0.0).alias("std"),
+            pl.len().alias("num_seeds"),
+        )
+        .sort("episode")
+        .collect()
+    )
+
+    # A single seed has no spread to build a band from
+    quantiles = {
+        n: _student_t_quantile(0.5 + confidence / 2, n - 1) if n > 1 else 0.0
+        for n in summary["num_seeds"].unique().to_list()
+    }
+    t = pl.col("num_seeds").replace_strict(quantiles, return_dtype=pl.Float64)
+    half_width = t * pl.col("std") / pl.col("num_seeds").sqrt()
+    summary = summary.with_columns(
+        (pl.col("mean") - half_width).alias("lower"),
+        (pl.col("mean") + half_width).alias("upper"),
+    )
+    summary.write_parquet(f"{results_dir}/summary.parquet")
+    return summary
+
+
+def train(
+    seeds: tuple[int, ...] = (1, 2, 3, 5, 8),  # Fibonacci seeds
+    total_num_episodes: int = 5_000,
+    num_workers: Optional[int] = None,
+    threads_per_worker: int = 1,
+    eval_every: Optional[int] = None,
+    eval_render_mode: Optional[str] = "rgb_array",
+):
+    """Train one REINFORCE agent per seed, each in its own process.
+
+    Training is headless. With `eval_every`, the policy of the first seed is
+    rendered or recorded every `eval_every` episodes by a `PolicyEvaluator`.
+
+    Args:
+        seeds: The seeds to sweep
+        total_num_episodes: Episodes per seed
+        num_workers: Processes running seeds at once, by default one per seed
+            within the cores available
+        threads_per_worker: Threads of torch in every process, so that the
+            processes do not oversubscribe the cores
+        eval_every: Episodes between evaluations, `None` to not evaluate
+        eval_render_mode: `"rgb_array"` to record the evaluations, `"human"` to
+            show them
+    """
+    import multiprocessing as mp
+    from concurrent.futures import ProcessPoolExecutor
 
-    rewards_to_plot = [rewards for rewards in rewards_over_seeds]
-    df1 = pl.DataFrame(rewards_to_plot).melt()
-    df1 = df1.rename({"variable": "episodes", "value": "reward"})
-    df1.plot.line(x="episodes", y="reward").show()
-    # sns.set(style="darkgrid", context="talk", palette="rainbow")
-    # sns.lineplot(x="episodes", y="reward", data=df1).set(
-    #     title="REINFORCE for InvertedPendulum-v4"
-    # )
-    # plt.show()
+    import altair as alt
+
+    results_dir = f"{METRICS_DIR}/reinforce_seeds"
+    os.makedirs(results_dir, exist_ok=True)
+    for name in os.listdir(results_dir):
+        os.remove(f"{results_dir}/{name}")
+
+    if num_workers is None:
+        num_workers = min(
+            len(seeds), max(1, (os.cpu_count() or 1) // threads_per_worker)
+        )
+    evaluator = None
+    if eval_every is not None:
+        env = gym.make("InvertedPendulum-v4")
+        evaluator = PolicyEvaluator(
+            gym.spaces.flatdim(env.observation_space),
+            gym.spaces.flatdim(env.action_space),
+            render_mode=eval_render_mode,
+        )
+        env.close()
+
+    with ProcessPoolExecutor(
+        num_workers, mp_context=mp.get_context("spawn")
+    ) as executor:
+        futures = [
+            executor.submit(
+                train_seed,
+                seed,
+                results_dir,
+                total_num_episodes,
+                threads_per_worker,
+                # Only the first seed is evaluated
+                snapshots=evaluator.snapshots if evaluator and i == 0 else None,
+                eval_every=eval_every if i == 0 else None,
+            )
+            for i, seed in enumerate(seeds)
+        ]
+        for future in futures:
+            future.result()
+    if evaluator is not None:
+        evaluator.close()
+
+    summary = summarize_seeds(results_dir)
+
+    alt.renderers.enable("browser")
+    base = alt.Chart(summary).encode(x="episode")
+    band = base.mark_area(opacity=0.3).encode(y="lower", y2="upper")
+    line = base.mark_line().encode(y=alt.Y("mean", title="reward"))
+    (band + line).properties(title="REINFORCE for InvertedPendulum-v4").show()
+
+
+def train_batched(
+    num_envs: int = 16,
+    num_updates: int = 1_000,
+    seed: int = 1,
+    env_id: str = "InvertedPendulum-v4",
+    eval_every: Optional[int] = None,
+    eval_render_mode: Optional[str] = "rgb_array",
+):
+    """Train REINFORCE on `num_envs` episodes per update, stepped together in a
+    vector environment.
+
+    Every update resets all the envs and steps them until each one has finished
+    its episode. Steps after the end of an episode are masked out.
+
+    Args:
+        num_envs: Episodes per update
+        num_updates: Number of updates
+        seed: Seed of torch, random, NumPy and the envs
+        env_id: The MuJoCo env to train on
+        eval_every: Updates between evaluations by a `PolicyEvaluator`, `None`
+            to not evaluate
+        eval_render_mode: `"rgb_array"` to record the evaluations, `"human"` to
+            show them
+    """
+    from simulation.metrics import MetricsRecorder, plot
+
+    envs = gym.make_vec(env_id, num_envs=num_envs, vectorization_mode="sync")
+    obs_space_dims = gym.spaces.flatdim(envs.single_observation_space)
+    action_space_dims = gym.spaces.flatdim(envs.single_action_space)
+    max_episode_steps = gym.spec(env_id).max_episode_steps
+    assert max_episode_steps is not None, f"{env_id} has no episode length limit"
+
+    torch.manual_seed(seed)
+    random.seed(seed)
+    np.random.seed(seed)
+    agent = REINFORCE(obs_space_dims, action_space_dims)
+    evaluator = None
+    if eval_every is not None:
+        evaluator = PolicyEvaluator(
+            obs_space_dims, action_space_dims, env_id, eval_render_mode
+        )
+
+    shape = (max_episode_steps, num_envs)
+    states = np.empty((*shape, obs_space_dims))
+    actions = np.empty((*shape, action_space_dims))
+    rewards = np.empty(shape)
+    mask = np.empty(shape, dtype=np.bool_)
+    active = np.empty(num_envs, dtype=np.bool_)
+
+    metrics = MetricsRecorder(f"{METRICS_DIR}/reinforce_batched_episodes.parquet")
+    obs, info = envs.reset(seed=seed)
+    for update in range(num_updates):
+        if update:
+            obs, info = envs.reset()
+
+        active[:] = True
+        for t in range(max_episode_steps):
+            states[t] = obs
+            actions[t] = agent.sample_actions(obs)
+            obs, rewards[t], terminated, truncated, info = envs.step(actions[t])
+            mask[t] = active
+            active &= ~(terminated | truncated)
+            if not active.any():
+                break
+        length = t + 1
+
+        agent.update_batch(
+            states[:length], actions[:length], rewards[:length], mask[:length]
+        )
+
+        episode_rewards = np.where(mask[:length], rewards[:length], 0.0).sum(0)
+        metrics.log_batch(
+            episode=np.arange(update * num_envs, (update + 1) * num_envs),
+            reward=episode_rewards,
+        )
+        if update % 100 == 0:
+            print("Update:", update, "Average Reward:", int(episode_rewards.mean()))
+        if eval_every is not None and update % eval_every == 0:
+            assert evaluator is not None
+            evaluator.submit(update * num_envs, agent.net)
+
+    envs.close()
+    if evaluator is not None:
+        evaluator.close()
+    metrics.close()
+    plot(metrics.path, x="episode", y="reward")
 
 
 def simple_render():
@@ -251,46 +674,66 @@ def simple_render():
     env.close()
 
 
-def pid():
-    model = mujoco.MjModel.from_xml_path(
-        f"{os.path.dirname(__file__)}/models/inverted_pendulum.xml"
-    )
-    data = mujoco.MjData(model)
+class PIDController:
+    """PID control of the cart force from the pole angle of
+    `models/inverted_pendulum.xml`, called as `controller(model, data)`."""
 
-    # PIDゲイン
-    Kp = 1500
-    Ki = 2500
-    Kd = 60
+    def __init__(self, Kp, Ki, Kd, time_step):
+        self.Kp = Kp
+        self.Ki = Ki
+        self.Kd = Kd
+        self.time_step = time_step
+        self.reset()
 
-    # 制御用の変数
-    integral = 0.0
-    prev_error = 0.0
+    def reset(self):
+        # 制御用の変数
+        self.integral = 0.0
+        self.prev_error = 0.0
 
-    # シミュレーションの設定
-    time_step = model.opt.timestep
+    def __call__(self, model, data):
+        # 現在の振子の角度（ジョイント位置）を取得
+        pendulum_angle = data.qpos[1]
 
-    with mujoco.viewer.launch_passive(model, data) as viewer:
-        while viewer.is_running():
-            # 現在の振子の角度（ジョイント位置）を取得
-            pendulum_angle = data.qpos[1]
+        error = pendulum_angle / (math.pi / 2)
+        self.integral += error * self.time_step
+        derivative = (error - self.prev_error) / self.time_step
+        control_force = self.Kp * error + self.Ki * self.integral + self.Kd * derivative
+        self.prev_error = error
 
-            error = pendulum_angle / (math.pi / 2)
-            integral += error * time_step
-            derivative = (error - prev_error) / time_step
-            control_force = Kp * error + Ki * integral + Kd * derivative
-            prev_error = error
+        # 制御力を適用（制御入力をアクチュエータに設定）
+        data.ctrl[0] = control_force
 
-            # 制御力を適用（制御入力をアクチュエータに設定）
-            data.ctrl[0] = control_force
 
-            # シミュレーションを1ステップ進める
-            mujoco.mj_step(model, data)
+def pid(Kp=1500, Ki=2500, Kd=60, realtime_factor=1.0, duration=None, viewer=True):
+    """Balance the inverted pendulum with a PID controller.
 
-            # GUIを更新
-            viewer.sync()
+    Args:
+        Kp: Proportional gain
+        Ki: Integral gain
+        Kd: Derivative gain, e.g. from `simulation.pid_tuning`
+        realtime_factor: Simulated seconds per wall-clock second, None to run
+            as fast as possible
+        duration: Simulated seconds to run, None to run until the viewer is closed
+        viewer: Whether to show the passive viewer
+
+    Returns:
+        The `RunStats` of the run
+    """
+    import mujoco
+
+    from simulation.realtime import SimulationRunner
+
+    model = mujoco.MjModel.from_xml_path(
+        f"{os.path.dirname(__file__)}/models/inverted_pendulum.xml"
+    )
+    data = mujoco.MjData(model)
+
+    # シミュレーションの設定
+    controller = PIDController(Kp, Ki, Kd, model.opt.timestep)
 
-            # スリープしてリアルタイムに近づける
-            time.sleep(time_step)
+    # 物理は壁時計に対する絶対スケジュールで進め、GUIは別スレッドで更新する
+    runner = SimulationRunner(model, data, controller, realtime_factor=realtime_factor)
+    return runner.run(duration, viewer=viewer)
 
 
 if __name__ == "__main__":
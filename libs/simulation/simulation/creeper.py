@@ -1,23 +1,19 @@
 import os
 
 import mujoco
-import mujoco.viewer
 
+from simulation.realtime import SimulationRunner
 
-def move():
+
+def move(realtime_factor=1.0):
     model = mujoco.MjModel.from_xml_path(
         f"{os.path.dirname(__file__)}/../data/Creeper/untitled.xml"
     )
     data = mujoco.MjData(model)
 
-    with mujoco.viewer.launch_passive(model, data) as viewer:
-        while viewer.is_running():
-            # mj_step can be replaced with code that also evaluates
-            # a policy and applies a control signal before stepping the physics.
-            mujoco.mj_step(model, data)
-
-            # Pick up changes to the physics state, apply perturbations, update options from GUI.
-            viewer.sync()
+    # SimulationRunner can be given a controller that evaluates a policy and
+    # applies a control signal before every physics step.
+    SimulationRunner(model, data, realtime_factor=realtime_factor).run()
 
 
 if __name__ == "__main__":
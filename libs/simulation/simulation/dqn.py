@@ -1,56 +1,446 @@
-import random
-from collections import deque
+import json
+import os
+import queue
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
 from os import path
+from typing import TYPE_CHECKING
 
-import altair as alt
-import gymnasium as gym
 import numpy as np
-import polars as pl
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
 import torch.optim as optim
-from gymnasium.envs.registration import register
-from gymnasium.wrappers import RecordVideo
-from stable_baselines3 import DQN, PPO
-from stable_baselines3.common.env_util import make_vec_env
-from stable_baselines3.common.vec_env import VecEnv
 
-from simulation.envs.wrappers.display_info import DisplayInfo
+import simulation.envs  # noqa: F401 (registers CartPole-v99)
+from simulation.inference import NumpyMLP
 
-alt.renderers.enable("browser")
+METRICS_DIR = f"{path.dirname(__file__)}/../data/metrics"
 
-
-register(
-    id="CartPole-v99",
-    entry_point="simulation.envs.cartpole:CartPoleEnv",
-    max_episode_steps=200,
-)
+# stable_baselines3, polars, altair and the gymnasium wrappers are imported by
+# the functions that use them, so that importing this module stays cheap.
+if TYPE_CHECKING:
+    from stable_baselines3.common.vec_env import VecEnv
 
 
 class ReplayBuffer:
+    """Ring buffer of transitions stored in one preallocated array per field.
+
+    The arrays are allocated on the first `add`, once the observation shape is known.
+    New transitions overwrite the oldest ones, and batches are gathered with
+    a single integer-index lookup per field. Adding and sampling hold `_lock`,
+    so that a `BatchPrefetcher` never copies a half-written transition.
+    """
+
+    # The dtype of every field. `states` and `next_states` hold one observation
+    # per slot, the other fields one scalar.
+    FIELDS = {
+        "states": np.float32,
+        "actions": np.int64,
+        "rewards": np.float32,
+        "next_states": np.float32,
+        "dones": np.int32,
+    }
+
     def __init__(self, buffer_size, batch_size):
-        self.buffer = deque(maxlen=buffer_size)
+        self.buffer_size = buffer_size
         self.batch_size = batch_size
 
+        self.cursor = 0  # slot written by the next transition
+        self.size = 0
+        self._lock = threading.Lock()
+
+        self.states = None
+        self.actions = None
+        self.rewards = None
+        self.next_states = None
+        self.dones = None
+
+    def _field_shape(self, name, state_shape):
+        if name in ("states", "next_states"):
+            return (self.buffer_size, *state_shape)
+        return (self.buffer_size,)
+
+    def _allocate(self, state_shape):
+        for name, dtype in self.FIELDS.items():
+            setattr(
+                self, name, np.empty(self._field_shape(name, state_shape), dtype=dtype)
+            )
+
     def add(self, state, action, reward, next_state, done):
-        data = (state, action, reward, next_state, done)
-        self.buffer.append(data)
+        with self._lock:
+            if self.states is None:
+                self._allocate(np.shape(state))
+
+            i = self.cursor
+            self.states[i] = state
+            self.actions[i] = action
+            self.rewards[i] = reward
+            self.next_states[i] = next_state
+            self.dones[i] = done
+
+            self.cursor = (i + 1) % self.buffer_size
+            self.size = min(self.size + 1, self.buffer_size)
+
+    def add_batch(self, states, actions, rewards, next_states, dones):
+        """Add `N` transitions at once, e.g. one step of a vector env."""
+        with self._lock:
+            if self.states is None:
+                self._allocate(np.shape(states)[1:])
+
+            # Only the last `buffer_size` transitions would survive anyway
+            n = min(len(states), self.buffer_size)
+            index = (self.cursor + np.arange(n)) % self.buffer_size
+            self.states[index] = states[-n:]
+            self.actions[index] = actions[-n:]
+            self.rewards[index] = rewards[-n:]
+            self.next_states[index] = next_states[-n:]
+            self.dones[index] = dones[-n:]
+
+            self.cursor = (self.cursor + n) % self.buffer_size
+            self.size = min(self.size + n, self.buffer_size)
 
     def __len__(self):
-        return len(self.buffer)
+        return self.size
 
     def get_batch(self):
-        data = random.sample(self.buffer, self.batch_size)
-
-        state = torch.tensor(np.stack([x[0] for x in data]))
-        action = torch.tensor(np.array([x[1] for x in data]).astype(np.int64))
-        reward = torch.tensor(np.array([x[2] for x in data]).astype(np.float32))
-        next_state = torch.tensor(np.stack([x[3] for x in data]))
-        done = torch.tensor(np.array([x[4] for x in data]).astype(np.int32))
+        # Sampled with replacement, which is indistinguishable from
+        # `random.sample` once the buffer is much larger than a batch.
+        with self._lock:
+            index = np.random.randint(self.size, size=self.batch_size)
+
+            state = torch.from_numpy(self.states[index])
+            action = torch.from_numpy(self.actions[index])
+            reward = torch.from_numpy(self.rewards[index])
+            next_state = torch.from_numpy(self.next_states[index])
+            done = torch.from_numpy(self.dones[index])
         return state, action, reward, next_state, done
 
 
+class MemmapReplayBuffer(ReplayBuffer):
+    """`ReplayBuffer` whose fields live in memory-mapped files under `directory`.
+
+    Every field is a fixed-dtype `.npy` file, so capacity can exceed RAM and the
+    OS page cache keeps the hot part in memory. `header.json` holds the cursor and
+    size as of the last `checkpoint`, which runs every `checkpoint_interval` added
+    transitions. Creating a buffer on a directory that already has a header
+    reopens its files and resumes from that checkpoint.
+    """
+
+    def __init__(self, buffer_size, batch_size, directory, checkpoint_interval=10_000):
+        super().__init__(buffer_size, batch_size)
+        self.directory = directory
+        self.checkpoint_interval = checkpoint_interval
+        self._since_checkpoint = 0
+        self._resumed_shape = None  # state shape of the files, until the next add
+
+        header_path = path.join(directory, "header.json")
+        if path.exists(header_path):
+            with open(header_path) as f:
+                header = json.load(f)
+            assert (
+                header["buffer_size"] == buffer_size
+            ), f"{directory} holds a buffer of size {header['buffer_size']}"
+            self.cursor = header["cursor"]
+            self.size = header["size"]
+            self._resumed_shape = tuple(header["state_shape"])
+            for name in self.FIELDS:
+                setattr(
+                    self,
+                    name,
+                    np.lib.format.open_memmap(
+                        path.join(directory, f"{name}.npy"), mode="r+"
+                    ),
+                )
+
+    def _allocate(self, state_shape):
+        os.makedirs(self.directory, exist_ok=True)
+        # Created on disk directly, without a copy in RAM first
+        for name, dtype in self.FIELDS.items():
+            setattr(
+                self,
+                name,
+                np.lib.format.open_memmap(
+                    path.join(self.directory, f"{name}.npy"),
+                    mode="w+",
+                    dtype=dtype,
+                    shape=self._field_shape(name, state_shape),
+                ),
+            )
+
+    def add(self, state, action, reward, next_state, done):
+        self._check_resumed_shape(np.shape(state))
+        super().add(state, action, reward, next_state, done)
+        self._count_added(1)
+
+    def add_batch(self, states, actions, rewards, next_states, dones):
+        self._check_resumed_shape(np.shape(states)[1:])
+        super().add_batch(states, actions, rewards, next_states, dones)
+        self._count_added(len(states))
+
+    def _check_resumed_shape(self, state_shape):
+        if self._resumed_shape is None:
+            return
+        assert state_shape == self._resumed_shape, (
+            f"{self.directory} holds states of shape {self._resumed_shape},"
+            f" not {state_shape}"
+        )
+        self._resumed_shape = None
+
+    def _count_added(self, n):
+        self._since_checkpoint += n
+        if self._since_checkpoint >= self.checkpoint_interval:
+            self.checkpoint()
+
+    def checkpoint(self):
+        """Flush the fields to disk, then atomically replace the header."""
+        if self.states is None:
+            return
+        for name in self.FIELDS:
+            getattr(self, name).flush()
+
+        header = {
+            "buffer_size": self.buffer_size,
+            "cursor": self.cursor,
+            "size": self.size,
+            "state_shape": list(self.states.shape[1:]),
+        }
+        header_path = path.join(self.directory, "header.json")
+        with open(f"{header_path}.tmp", "w") as f:
+            json.dump(header, f)
+        os.replace(f"{header_path}.tmp", header_path)
+        self._since_checkpoint = 0
+
+
+class StageTimer:
+    """Accumulates wall-clock time per named stage of the training loop."""
+
+    def __init__(self):
+        self.totals = defaultdict(float)
+        self.counts = defaultdict(int)
+
+    @contextmanager
+    def time(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.totals[stage] += time.perf_counter() - start
+            self.counts[stage] += 1
+
+    def summary(self):
+        return ", ".join(
+            f"{stage}: {total:.2f}s / {self.counts[stage]}"
+            for stage, total in self.totals.items()
+        )
+
+
+class BatchPrefetcher:
+    """Samples the next `num_batches` batches of a `ReplayBuffer` in a background thread.
+
+    Batches are gathered straight into a pool of `num_batches + 1` reusable tensor
+    slots, pinned when `pin_memory` is set and CUDA is available, and handed over
+    through a bounded queue. A slot returned by `get` stays valid until the next
+    call. The "sample" stage of `timer` is the time spent preparing batches, and
+    "wait" the time the learner was blocked on one, so their difference is the
+    sampling time taken off the learner.
+
+    The buffer keeps receiving transitions while batches are prepared, so a batch
+    can be up to `num_batches` updates stale. Each batch is copied under the lock
+    of the buffer, so its rows are whole transitions. Prioritized replay is not supported,
+    since its priorities change after every update.
+    """
+
+    def __init__(self, replay_buffer, num_batches=2, pin_memory=False, timer=None):
+        assert not isinstance(
+            replay_buffer, PrioritizedReplayBuffer
+        ), "Prioritized replay cannot be prefetched."
+        self.replay_buffer = replay_buffer
+        self.timer = timer if timer is not None else StageTimer()
+
+        fields = [
+            replay_buffer.states,
+            replay_buffer.actions,
+            replay_buffer.rewards,
+            replay_buffer.next_states,
+            replay_buffer.dones,
+        ]
+        pin_memory = pin_memory and torch.cuda.is_available()
+        self._slots = [
+            tuple(
+                torch.empty(
+                    (replay_buffer.batch_size, *field.shape[1:]),
+                    dtype=torch.from_numpy(field[:0]).dtype,
+                    pin_memory=pin_memory,
+                )
+                for field in fields
+            )
+            for _ in range(num_batches + 1)
+        ]
+        self._fields = fields
+
+        self._free = queue.Queue()
+        for slot in range(len(self._slots)):
+            self._free.put(slot)
+        self._ready = queue.Queue(maxsize=num_batches)
+        self._held = None
+        self._stop = threading.Event()
+
+        self._rng = np.random.default_rng()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            slot = self._free.get()
+            if slot is None:
+                return
+            with self.timer.time("sample"), self.replay_buffer._lock:
+                index = self._rng.integers(
+                    self.replay_buffer.size, size=self.replay_buffer.batch_size
+                )
+                for field, tensor in zip(self._fields, self._slots[slot]):
+                    np.take(field, index, axis=0, out=tensor.numpy())
+            # The ready queue stays full when nobody calls `get`, e.g. after `close`
+            while not self._stop.is_set():
+                try:
+                    self._ready.put(slot, timeout=0.1)
+                    break
+                except queue.Full:
+                    pass
+
+    def get(self):
+        """The next batch as `(state, action, reward, next_state, done)` tensors."""
+        if self._held is not None:
+            self._free.put(self._held)
+        with self.timer.time("wait"):
+            self._held = self._ready.get()
+        return self._slots[self._held]
+
+    def close(self):
+        self._stop.set()
+        self._free.put(None)
+        self._thread.join()
+
+
+class SumTree:
+    """Binary sum-tree over `capacity` priorities, stored in a flat array.
+
+    Node `i` has children `2i` and `2i + 1`, the root is node 1 and the leaves
+    start at `self.leaves`. Updates and prefix-sum lookups are batched, with one
+    vectorized pass per tree level.
+    """
+
+    def __init__(self, capacity):
+        self.leaves = 1 << max(0, capacity - 1).bit_length()
+        self.depth = self.leaves.bit_length() - 1
+        self.tree = np.zeros(2 * self.leaves, dtype=np.float64)
+
+    @property
+    def total(self):
+        return self.tree[1]
+
+    def update(self, index, priority):
+        """Set the priorities of the data `index`es and refresh their ancestors."""
+        if np.ndim(index) == 0:
+            node = int(index) + self.leaves
+            self.tree[node] = priority
+            for _ in range(self.depth):
+                node >>= 1
+                self.tree[node] = self.tree[2 * node] + self.tree[2 * node + 1]
+            return
+
+        nodes = np.asarray(index) + self.leaves
+        self.tree[nodes] = priority
+        for _ in range(self.depth):
+            # Shared ancestors are written more than once, with the same sum
+            nodes >>= 1
+            self.tree[nodes] = self.tree[2 * nodes] + self.tree[2 * nodes + 1]
+
+    def find(self, value):
+        """Data indices whose cumulative priority range contains each of `value`."""
+        value = np.array(value, dtype=np.float64)
+        nodes = np.ones(len(value), dtype=np.int64)
+        for _ in range(self.depth):
+            left = 2 * nodes
+            left_sum = self.tree[left]
+            go_right = value > left_sum
+            value -= left_sum * go_right
+            nodes = left + go_right
+        return nodes - self.leaves
+
+
+class PrioritizedReplayBuffer(ReplayBuffer):
+    """`ReplayBuffer` that samples transitions in proportion to their priority.
+
+    Implements proportional prioritized experience replay (Schaul et al., 2016):
+    a batch is drawn with one stratified sample per equal slice of the total
+    priority, and `get_batch` also returns the importance-sampling weights of the
+    batch. Priorities of the last batch are set from its TD errors with
+    `update_priorities`. New transitions get the highest priority seen so far.
+    """
+
+    def __init__(
+        self,
+        buffer_size,
+        batch_size,
+        alpha=0.6,
+        beta=0.4,
+        beta_increment=1e-5,
+        eps=1e-6,
+    ):
+        super().__init__(buffer_size, batch_size)
+        self.alpha = alpha
+        self.beta = beta  # annealed towards 1 by `beta_increment` per batch
+        self.beta_increment = beta_increment
+        self.eps = eps
+
+        self.sum_tree = SumTree(buffer_size)
+        self.max_priority = 1.0
+        self.index = None  # indices of the last batch
+
+    def add(self, state, action, reward, next_state, done):
+        index = self.cursor
+        super().add(state, action, reward, next_state, done)
+        self.sum_tree.update(index, self.max_priority**self.alpha)
+
+    def add_batch(self, states, actions, rewards, next_states, dones):
+        n = min(len(states), self.buffer_size)
+        index = (self.cursor + np.arange(n)) % self.buffer_size
+        super().add_batch(states, actions, rewards, next_states, dones)
+        self.sum_tree.update(index, self.max_priority**self.alpha)
+
+    def get_batch(self):
+        total = self.sum_tree.total
+        segment = total / self.batch_size
+        value = (np.arange(self.batch_size) + np.random.rand(self.batch_size)) * segment
+        # Rounding can push a lookup past the last stored transition
+        index = np.minimum(self.sum_tree.find(value), self.size - 1)
+        self.index = index
+
+        # w_i = (N * P(i)) ** -beta, normalized by the largest weight of the batch
+        probs = self.sum_tree.tree[index + self.sum_tree.leaves] / total
+        weights = (self.size * probs) ** -self.beta
+        weights /= weights.max()
+        self.beta = min(1.0, self.beta + self.beta_increment)
+
+        state = torch.from_numpy(self.states[index])
+        action = torch.from_numpy(self.actions[index])
+        reward = torch.from_numpy(self.rewards[index])
+        next_state = torch.from_numpy(self.next_states[index])
+        done = torch.from_numpy(self.dones[index])
+        weight = torch.from_numpy(weights.astype(np.float32))
+        return state, action, reward, next_state, done, weight
+
+    def update_priorities(self, td_errors):
+        """Set the priorities of the last batch from its absolute TD errors."""
+        priorities = np.abs(td_errors) + self.eps
+        self.max_priority = max(self.max_priority, float(priorities.max()))
+        self.sum_tree.update(self.index, priorities**self.alpha)
+
+
 class QNet(nn.Module):
     def __init__(self, action_size):
         super().__init__()
@@ -64,9 +454,22 @@ class QNet(nn.Module):
         x = self.l3(x)
         return x
 
+    def inference(self, max_batch_size=1):
+        """Autograd-free NumPy evaluator that tracks the weights of this network."""
+        return NumpyMLP(
+            [self.l1, self.l2, self.l3], ["relu", "relu", None], max_batch_size
+        )
+
 
 class DQNAgent:
-    def __init__(self):
+    def __init__(
+        self,
+        prioritized=False,
+        replay_dir=None,
+        prefetch=0,
+        pin_memory=False,
+        replay_buffer=None,
+    ):
         self.gamma = 0.98
         self.lr = 0.0005
         self.epsilon = 0.1
@@ -74,51 +477,139 @@ class DQNAgent:
         self.batch_size = 32
         self.action_size = 2
 
-        self.replay_buffer = ReplayBuffer(self.buffer_size, self.batch_size)
+        self.prioritized = prioritized
+        assert not (
+            prioritized and replay_dir
+        ), "Prioritized replay is not supported on disk."
+        if replay_buffer is not None:
+            # e.g. the shared buffer of `simulation.apex`
+            assert not (prioritized or replay_dir)
+            self.replay_buffer = replay_buffer
+        elif prioritized:
+            self.replay_buffer = PrioritizedReplayBuffer(
+                self.buffer_size, self.batch_size
+            )
+        elif replay_dir is not None:
+            # Resumes the buffer left in `replay_dir` by a previous run
+            self.replay_buffer = MemmapReplayBuffer(
+                self.buffer_size, self.batch_size, replay_dir
+            )
+        else:
+            self.replay_buffer = ReplayBuffer(self.buffer_size, self.batch_size)
         self.qnet = QNet(self.action_size)
         self.qnet_target = QNet(self.action_size)
+        self.qnet_inference = self.qnet.inference()
         self.optimizer = optim.Adam(self.qnet.parameters(), lr=self.lr)
 
+        # With `prefetch > 0`, batches are sampled ahead in a background thread
+        # once the buffer holds a full batch, into pinned memory with `pin_memory`.
+        self.prefetch = prefetch
+        self.pin_memory = pin_memory
+        self.prefetcher = None
+        self.timer = StageTimer()
+
     def get_action(self, state):
         if np.random.rand() < self.epsilon:
             return np.random.choice(self.action_size)
         else:
-            state = torch.tensor(state[np.newaxis, :])
-            qs = self.qnet(state)
-            return qs.argmax().item()
+            qs = self.qnet_inference(state[np.newaxis, :])
+            return int(qs[0].argmax())
+
+    def get_actions(self, states):
+        """Epsilon-greedy actions for a batch of `(N, 4)` observations.
+
+        Every env explores independently, and the greedy actions of all envs come
+        from a single forward pass without autograd.
+        """
+        actions = self.qnet_inference(states).argmax(1)
+
+        explore = np.random.rand(len(actions)) < self.epsilon
+        num_explore = np.count_nonzero(explore)
+        if num_explore:
+            actions[explore] = np.random.randint(self.action_size, size=num_explore)
+        return actions
 
     def update(self, state, action, reward, next_state, done):
+        """Add a transition and take a gradient step, returning its loss, or `None`
+        while the buffer holds less than a batch."""
         self.replay_buffer.add(state, action, reward, next_state, done)
-        if len(self.replay_buffer) < self.batch_size:
-            return
+        if len(self.replay_buffer) >= self.batch_size:
+            return self.learn()
+
+    def update_batch(self, states, actions, rewards, next_states, dones, updates=1):
+        """Add the `N` transitions of a vector env step, then take `updates` gradient
+        steps, returning the loss of the last one like `update`."""
+        self.replay_buffer.add_batch(states, actions, rewards, next_states, dones)
+        loss = None
+        if len(self.replay_buffer) >= self.batch_size:
+            for _ in range(updates):
+                loss = self.learn()
+        return loss
+
+    def learn(self):
+        """Take one gradient step on a batch from the replay buffer and return its
+        loss. The buffer must hold at least a batch."""
+        weight = None
+        if self.prefetch:
+            if self.prefetcher is None:
+                self.prefetcher = BatchPrefetcher(
+                    self.replay_buffer,
+                    self.prefetch,
+                    pin_memory=self.pin_memory,
+                    timer=self.timer,
+                )
+            state, action, reward, next_state, done = self.prefetcher.get()
+        elif self.prioritized:
+            with self.timer.time("sample"):
+                state, action, reward, next_state, done, weight = (
+                    self.replay_buffer.get_batch()
+                )
+        else:
+            with self.timer.time("sample"):
+                state, action, reward, next_state, done = self.replay_buffer.get_batch()
 
-        state, action, reward, next_state, done = self.replay_buffer.get_batch()
-        qs = self.qnet(state)
-        q = qs[np.arange(self.batch_size), action]
+        with self.timer.time("learn"):
+            qs = self.qnet(state)
+            q = qs[np.arange(self.batch_size), action]
 
-        next_qs = self.qnet_target(next_state)
-        next_q = next_qs.max(1)[0]
+            next_qs = self.qnet_target(next_state)
+            next_q = next_qs.max(1)[0]
 
-        next_q.detach()
-        target = reward + (1 - done) * self.gamma * next_q
+            next_q.detach()
+            target = reward + (1 - done) * self.gamma * next_q
 
-        loss_fn = nn.MSELoss()
-        loss = loss_fn(q, target)
+            if self.prioritized:
+                td_error = target - q
+                loss = (weight * td_error.pow(2)).mean()
+                self.replay_buffer.update_priorities(td_error.detach().numpy())
+            else:
+                loss_fn = nn.MSELoss()
+                loss = loss_fn(q, target)
 
-        self.optimizer.zero_grad()
-        loss.backward()
-        self.optimizer.step()
+            self.optimizer.zero_grad()
+            loss.backward()
+            self.optimizer.step()
+        return loss.item()
 
     def sync_qnet(self):
         self.qnet_target.load_state_dict(self.qnet.state_dict())
 
+    def close(self):
+        if self.prefetcher is not None:
+            self.prefetcher.close()
+            self.prefetcher = None
+
+
+def naive(env, replay_dir=None, prefetch=0, prioritized=False):
+    from simulation.metrics import MetricsRecorder, plot
 
-def naive(env):
     episodes = 100_000
     sync_interval = 20
 
-    agent = DQNAgent()
-    reward_history = []
+    agent = DQNAgent(prioritized=prioritized, replay_dir=replay_dir, prefetch=prefetch)
+    episode_metrics = MetricsRecorder(f"{METRICS_DIR}/dqn_naive_episodes.parquet")
+    step_metrics = MetricsRecorder(f"{METRICS_DIR}/dqn_naive_steps.parquet")
+    num_updates = 0
 
     for episode in range(episodes):
         obs, _ = env.reset()
@@ -129,7 +620,10 @@ def naive(env):
             action = agent.get_action(obs)
             next_obs, reward, terminated, truncated, info = env.step(action)
 
-            agent.update(obs, action, reward, next_obs, done)
+            loss = agent.update(obs, action, reward, next_obs, done)
+            if loss is not None:
+                step_metrics.log(step=num_updates, loss=loss)
+                num_updates += 1
             obs = next_obs
             total_reward += reward
 
@@ -141,20 +635,103 @@ def naive(env):
         if episode % sync_interval == 0:
             agent.sync_qnet()
 
-        reward_history.append(total_reward)
+        episode_metrics.log(episode=episode, reward=float(total_reward))
         if episode % 10 == 0:
             print("episode :{}, total reward : {}".format(episode, total_reward))
 
-    df = pl.DataFrame(
-        {
-            "episode": list(range(episodes)),
-            "reward": reward_history,
-        }
-    )
-    df.plot.line(x="episode", y="reward").show()
+    agent.close()
+    episode_metrics.close()
+    step_metrics.close()
+    print("time per stage:", agent.timer.summary())
+    if replay_dir is not None:
+        agent.replay_buffer.checkpoint()
+
+    plot(episode_metrics.path, x="episode", y="reward")
+
+
+def vectorized(
+    num_envs=16,
+    total_steps=200_000,
+    updates_per_step=1,
+    prefetch=0,
+    prioritized=False,
+):
+    """`naive` collecting from `num_envs` cart-poles stepped as one `CartPoleVectorEnv`.
+
+    Every vector step adds up to `num_envs` transitions and takes
+    `updates_per_step` gradient steps, and the target network is synced every
+    `sync_interval` vector steps. `prioritized` samples with prioritized
+    experience replay, which cannot be combined with `prefetch`.
+    """
+    from simulation.envs.cartpole import CartPoleVectorEnv
+    from simulation.metrics import MetricsRecorder, plot
+
+    sync_interval = 500
+
+    env = CartPoleVectorEnv(num_envs=num_envs, inplace=True)
+    agent = DQNAgent(prioritized=prioritized, prefetch=prefetch)
+    episode_metrics = MetricsRecorder(f"{METRICS_DIR}/dqn_vectorized_episodes.parquet")
+    step_metrics = MetricsRecorder(f"{METRICS_DIR}/dqn_vectorized_steps.parquet")
+    num_episodes = 0
+
+    # The in-place env overwrites its observations on every step, so keep a copy
+    obs_, _ = env.reset()
+    obs = obs_.copy()
+    total_reward = np.zeros(num_envs)
+    was_done = np.zeros(num_envs, dtype=np.bool_)
+
+    for step in range(total_steps // num_envs):
+        actions = agent.get_actions(obs)
+        next_obs, rewards, terminated, truncated, info = env.step(actions)
+
+        # Envs done at the previous step were just reset by this one, and their
+        # transition from the final observation is not a real one.
+        valid = ~was_done
+        loss = agent.update_batch(
+            obs[valid],
+            actions[valid],
+            rewards[valid],
+            next_obs[valid],
+            terminated[valid],
+            updates=updates_per_step,
+        )
+        if loss is not None:
+            step_metrics.log(step=step, loss=loss)
+        np.copyto(obs, next_obs)
+        total_reward += rewards
+
+        done = terminated | truncated
+        num_done = np.count_nonzero(done)
+        if num_done:
+            episode_metrics.log_batch(
+                episode=np.arange(num_episodes, num_episodes + num_done),
+                reward=total_reward[done],
+            )
+            if num_episodes // 10 != (num_episodes + num_done) // 10:
+                print(
+                    "episode :{}, total reward : {}".format(
+                        num_episodes, total_reward[done][0]
+                    )
+                )
+            num_episodes += num_done
+        total_reward[done] = 0.0
+        np.copyto(was_done, done)
+
+        if step % sync_interval == 0:
+            agent.sync_qnet()
+
+    agent.close()
+    env.close()
+    episode_metrics.close()
+    step_metrics.close()
+    print("time per stage:", agent.timer.summary())
+
+    plot(episode_metrics.path, x="episode", y="reward")
 
 
 def sb3_dqn(env):
+    from stable_baselines3 import DQN
+
     model = DQN("MlpPolicy", env, verbose=1)
     model.learn(total_timesteps=100_000)
     model.save("dqn_cartpole")
@@ -175,7 +752,9 @@ def sb3_dqn(env):
         done = terminated or truncated
 
 
-def sb3_ppo(vec_env: VecEnv):
+def sb3_ppo(vec_env: "VecEnv"):
+    from stable_baselines3 import PPO
+
     model = PPO("MlpPolicy", vec_env, verbose=1)
     model.learn(total_timesteps=50_000)
     model.save("ppo_cartpole")
@@ -209,6 +788,12 @@ def _episode_trigger(episode_id: int) -> bool:
 
 
 if __name__ == "__main__":
+    import gymnasium as gym
+    from gymnasium.wrappers import RecordVideo
+    from stable_baselines3.common.env_util import make_vec_env
+
+    from simulation.envs.wrappers.display_info import DisplayInfo
+
     # env = gym.make("CartPole-v99", render_mode="human")
     # env = gym.make("CartPole-v0")
     env = RecordVideo(
@@ -1,7 +1,10 @@
 from gymnasium.envs.registration import register
 
+# Both entry points are resolved lazily by gymnasium, so importing this package
+# does not import the environment modules.
 register(
     id="CartPole-v99",
-    entry_point="cartpole:CartPoleEnv",
+    entry_point="simulation.envs.cartpole:CartPoleEnv",
+    vector_entry_point="simulation.envs.cartpole:CartPoleVectorEnv",
     max_episode_steps=200,
 )
@@ -6,16 +6,30 @@ permalink: https://perma.cc/C9ZM-652R
 """
 
 import math
-from typing import Optional, Tuple, Union
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Callable, Optional, Tuple, Union
 
 import gymnasium as gym
 import numpy as np
 from gymnasium import logger, spaces
 from gymnasium.envs.classic_control import utils
 from gymnasium.error import DependencyNotInstalled
-from gymnasium.vector import VectorEnv
+from gymnasium.experimental.vector import VectorEnv
 from gymnasium.vector.utils import batch_space
 
+from simulation.envs.cartpole_rendering import CartPoleRasterizer
+
+if TYPE_CHECKING:
+    import torch
+
+# Physical parameters of `CartPoleVectorEnv` that can be set or randomized per env
+PHYSICAL_PARAMS = ("gravity", "masscart", "masspole", "length", "force_mag", "tau")
+
+# Either `(low, high)` of a uniform distribution, or `sample(rng, size) -> values`
+ParamDistribution = Union[
+    Tuple[float, float], Callable[[np.random.Generator, int], np.ndarray]
+]
+
 
 class CartPoleEnv(gym.Env[np.ndarray, Union[int, np.ndarray]]):
     """
@@ -117,7 +131,10 @@ class CartPoleEnv(gym.Env[np.ndarray, Union[int, np.ndarray]]):
     }
 
     def __init__(
-        self, sutton_barto_reward: bool = False, render_mode: Optional[str] = None
+        self,
+        sutton_barto_reward: bool = False,
+        render_mode: Optional[str] = None,
+        reuse_render_buffer: bool = False,
     ):
         self._sutton_barto_reward = sutton_barto_reward
 
@@ -159,6 +176,15 @@ class CartPoleEnv(gym.Env[np.ndarray, Union[int, np.ndarray]]):
         self.isopen = True
         self.state: np.ndarray | None = None
 
+        # Static layers and pole geometry built on the first render
+        self._background = None
+        self._pole_corners: list[tuple[float, float]] | None = None
+        # With `reuse_render_buffer`, "rgb_array" frames are written into one
+        # array that the next render overwrites. Leave it off for consumers that
+        # keep the frames, such as `RecordVideo`.
+        self.reuse_render_buffer = reuse_render_buffer
+        self._frame: np.ndarray | None = None
+
         self.steps_beyond_terminated = None
 
     def step(self, action):
@@ -288,68 +314,90 @@ class CartPoleEnv(gym.Env[np.ndarray, Union[int, np.ndarray]]):
         polelen = scale * (2 * self.length)
         cartwidth = 50.0
         cartheight = 30.0
+        axleoffset = cartheight / 4.0
+        carty = 100  # TOP OF CART
+
+        # Shapes are drawn with y already flipped, instead of flipping the
+        # whole surface afterwards. gfxdraw truncates coordinates, so y is
+        # truncated before flipping to hit the same pixels.
+        flip = self.screen_height - 1
+
+        if self._background is None:
+            self._background = pygame.Surface((self.screen_width, self.screen_height))
+            self._background.fill((255, 255, 255))
+            gfxdraw.hline(
+                self._background, 0, self.screen_width, flip - carty, (0, 0, 0)
+            )
+
+            l, r, t, b = (
+                -polewidth / 2,
+                polewidth / 2,
+                polelen - polewidth / 2,
+                -polewidth / 2,
+            )
+            self._pole_corners = [(l, b), (l, t), (r, t), (r, b)]
 
         if self.state is None:
             return None
 
         x = self.state
 
-        self.surf = pygame.Surface((self.screen_width, self.screen_height))
-        self.surf.fill((255, 255, 255))
+        self.screen.blit(self._background, (0, 0))
 
         l, r, t, b = -cartwidth / 2, cartwidth / 2, cartheight / 2, -cartheight / 2
-        axleoffset = cartheight / 4.0
         cartx = x[0] * scale + self.screen_width / 2.0  # MIDDLE OF CART
-        carty = 100  # TOP OF CART
         cart_coords = [(l, b), (l, t), (r, t), (r, b)]
-        cart_coords = [(c[0] + cartx, c[1] + carty) for c in cart_coords]
-        gfxdraw.aapolygon(self.surf, cart_coords, (0, 0, 0))
-        gfxdraw.filled_polygon(self.surf, cart_coords, (0, 0, 0))
-
-        l, r, t, b = (
-            -polewidth / 2,
-            polewidth / 2,
-            polelen - polewidth / 2,
-            -polewidth / 2,
-        )
-
-        pole_coords = []
-        for coord in [(l, b), (l, t), (r, t), (r, b)]:
-            coord = pygame.math.Vector2(coord).rotate_rad(-x[2])
-            coord = (coord[0] + cartx, coord[1] + carty + axleoffset)
-            pole_coords.append(coord)
-        gfxdraw.aapolygon(self.surf, pole_coords, (202, 152, 101))
-        gfxdraw.filled_polygon(self.surf, pole_coords, (202, 152, 101))
+        cart_coords = [(c[0] + cartx, flip - int(c[1] + carty)) for c in cart_coords]
+        gfxdraw.aapolygon(self.screen, cart_coords, (0, 0, 0))
+        gfxdraw.filled_polygon(self.screen, cart_coords, (0, 0, 0))
+
+        # Rotation of the pole corners by -theta, as `Vector2.rotate_rad(-x[2])`
+        costheta = math.cos(x[2])
+        sintheta = math.sin(x[2])
+        axley = carty + axleoffset
+        assert self._pole_corners is not None
+        pole_coords = [
+            (
+                cartx + u * costheta + v * sintheta,
+                flip - int(axley - u * sintheta + v * costheta),
+            )
+            for u, v in self._pole_corners
+        ]
+        gfxdraw.aapolygon(self.screen, pole_coords, (202, 152, 101))
+        gfxdraw.filled_polygon(self.screen, pole_coords, (202, 152, 101))
 
         gfxdraw.aacircle(
-            self.surf,
+            self.screen,
             int(cartx),
-            int(carty + axleoffset),
+            flip - int(axley),
             int(polewidth / 2),
             (129, 132, 203),
         )
         gfxdraw.filled_circle(
-            self.surf,
+            self.screen,
             int(cartx),
-            int(carty + axleoffset),
+            flip - int(axley),
             int(polewidth / 2),
             (129, 132, 203),
         )
 
-        gfxdraw.hline(self.surf, 0, self.screen_width, carty, (0, 0, 0))
-
-        self.surf = pygame.transform.flip(self.surf, False, True)
-        self.screen.blit(self.surf, (0, 0))
-
         if self.render_mode == "human":
             pygame.event.pump()
             self.clock.tick(self.metadata["render_fps"])
             pygame.display.flip()
 
         elif self.render_mode == "rgb_array":
-            return np.transpose(
-                np.array(pygame.surfarray.pixels3d(self.screen)), axes=(1, 0, 2)
-            )
+            # Row-major RGB bytes, much cheaper than copying the transposed
+            # `pixels3d` view of the 32-bit surface.
+            pixels = np.frombuffer(
+                pygame.image.tobytes(self.screen, "RGB"), dtype=np.uint8
+            ).reshape(self.screen_height, self.screen_width, 3)
+            if not self.reuse_render_buffer:
+                return pixels.copy()
+            if self._frame is None:
+                self._frame = np.empty(pixels.shape, dtype=np.uint8)
+            np.copyto(self._frame, pixels)
+            return self._frame
 
     def close(self):
         if self.screen is not None:
@@ -361,8 +409,11 @@ class CartPoleEnv(gym.Env[np.ndarray, Union[int, np.ndarray]]):
 
 
 class CartPoleVectorEnv(VectorEnv):
+    # "rgb_array" draws every env with pygame and returns a list of frames.
+    # "rgb_array_batch" rasterizes all envs with NumPy into one reused
+    # `(num_envs, 400, 600, 3)` array, without the pygame dependency.
     metadata = {
-        "render_modes": ["rgb_array"],
+        "render_modes": ["rgb_array", "rgb_array_batch"],
         "render_fps": 50,
     }
 
@@ -372,6 +423,12 @@ class CartPoleVectorEnv(VectorEnv):
         max_episode_steps: int = 500,
         render_mode: Optional[str] = None,
         sutton_barto_reward: bool = False,
+        inplace: bool = False,
+        validate_actions: bool = False,
+        shard_size: Optional[int] = None,
+        num_threads: int = 1,
+        backend: str = "numpy",
+        param_distributions: Optional[dict[str, ParamDistribution]] = None,
     ):
         self._sutton_barto_reward = sutton_barto_reward
 
@@ -379,17 +436,68 @@ class CartPoleVectorEnv(VectorEnv):
         self.max_episode_steps = max_episode_steps
         self.render_mode = render_mode
 
-        self.gravity = 9.8
-        self.masscart = 1.0
-        self.masspole = 0.1
-        self.total_mass = self.masspole + self.masscart
-        self.length = 0.5  # actually half the pole's length
-        self.polemass_length = self.masspole * self.length
-        self.force_mag = 10.0
-        self.tau = 0.02  # seconds between state updates
+        # In-place mode keeps a float32 (4, num_envs) state and preallocated
+        # work buffers. `step` then returns views into these buffers, which are
+        # overwritten by the next call; copy them if they need to be kept.
+        self.inplace = inplace
+        # Only consulted in in-place mode, the default `step` always validates.
+        self.validate_actions = validate_actions
+
+        # Sharded mode splits the in-place state into contiguous chunks of
+        # `shard_size` envs, stepped on a pool of `num_threads` threads. Every
+        # shard draws its resets from its own RNG stream, so results only depend
+        # on the seed and `shard_size`, not on `num_threads`.
+        assert (
+            shard_size is None or inplace
+        ), "Sharded stepping requires `inplace=True`."
+        self.shard_size = shard_size
+        self.num_threads = num_threads
+        self._shards = (
+            [
+                slice(start, min(start + shard_size, num_envs))
+                for start in range(0, num_envs, shard_size)
+            ]
+            if shard_size is not None
+            else [slice(None)]
+        )
+        self._shard_rngs: list[np.random.Generator] = []
+        self._executor = (
+            ThreadPoolExecutor(max_workers=num_threads) if num_threads > 1 else None
+        )
+
+        # The torch backend takes actions and returns observations, rewards and
+        # done flags as CPU tensors. These share memory with the in-place buffers,
+        # so neither side of a step pays for a conversion or a copy.
+        assert backend in ("numpy", "torch"), f"Unknown backend {backend!r}"
+        assert (
+            backend == "numpy" or inplace
+        ), "The torch backend requires `inplace=True`."
+        self.backend = backend
+        self._tensors: Optional[tuple] = None
+        self._rollout_tensors: Optional[tuple] = None
+
+        # Domain randomization: the parameters listed here become per-env arrays,
+        # sampled on reset and resampled for every env that autoresets.
+        self.param_distributions = dict(param_distributions or {})
+        assert set(self.param_distributions) <= set(
+            PHYSICAL_PARAMS
+        ), f"Only {PHYSICAL_PARAMS} can be randomized"
+
+        # Scalars, or arrays of shape `(num_envs,)` once set or randomized per env
+        self.gravity: Union[float, np.ndarray] = 9.8
+        self.masscart: Union[float, np.ndarray] = 1.0
+        self.masspole: Union[float, np.ndarray] = 0.1
+        self.total_mass: Union[float, np.ndarray] = self.masspole + self.masscart
+        self.length: Union[float, np.ndarray] = 0.5  # actually half the pole's length
+        self.polemass_length: Union[float, np.ndarray] = self.masspole * self.length
+        self.force_mag: Union[float, np.ndarray] = 10.0
+        self.tau: Union[float, np.ndarray] = 0.02  # seconds between state updates
+        self._masspole_ratio: Union[float, np.ndarray]
+        self._polemass_length_ratio: Union[float, np.ndarray]
         self.kinematics_integrator = "euler"
+        self._update_derived_params()
 
-        self.state = None
+        self.state: Optional[np.ndarray] = None
 
         self.steps = np.zeros(num_envs, dtype=np.int32)
         self.prev_done = np.zeros(num_envs, dtype=np.bool_)
@@ -422,12 +530,29 @@ class CartPoleVectorEnv(VectorEnv):
         self.screen_height = 400
         self.screens = None
         self.surf = None
+        self.rasterizer: Optional[CartPoleRasterizer] = None
 
         self.steps_beyond_terminated = None
 
+        if self.inplace:
+            # Rows: force, costheta, sintheta, temp, thetaacc, xacc
+            self._work = np.empty((6, num_envs), dtype=np.float32)
+            self._out_of_bounds = np.empty(num_envs, dtype=np.bool_)
+            self._reward = np.empty(num_envs, dtype=np.float32)
+            self._terminated = np.empty(num_envs, dtype=np.bool_)
+            self._truncated = np.empty(num_envs, dtype=np.bool_)
+
+        # Output buffers of `step_n`, grown to the longest rollout requested
+        self._rollout: Optional[
+            Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]
+        ] = None
+
     def step(
-        self, action: np.ndarray
+        self, action: Union[np.ndarray, "torch.Tensor"]
     ) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, dict]:
+        if self.inplace:
+            return self._step_inplace(action)
+
         assert self.action_space.contains(
             action
         ), f"{action!r} ({type(action)}) invalid"
@@ -460,7 +585,8 @@ class CartPoleVectorEnv(VectorEnv):
             theta_dot = theta_dot + self.tau * thetaacc
             theta = theta + self.tau * theta_dot
 
-        self.state = np.stack((x, x_dot, theta, theta_dot))
+        state = np.stack((x, x_dot, theta, theta_dot))
+        self.state = state
 
         terminated: np.ndarray = (
             (x < -self.x_threshold)
@@ -479,9 +605,11 @@ class CartPoleVectorEnv(VectorEnv):
             reward = np.ones_like(terminated, dtype=np.float32)
 
         # Reset all environments which terminated or were truncated in the last step
-        self.state[:, self.prev_done] = self.np_random.uniform(
+        state[:, self.prev_done] = self.np_random.uniform(
             low=self.low, high=self.high, size=(4, self.prev_done.sum())
         )
+        if self.param_distributions and self.prev_done.any():
+            self._resample_params(self.np_random, slice(None), self.prev_done)
         self.steps[self.prev_done] = 0
         reward[self.prev_done] = 0.0
         terminated[self.prev_done] = False
@@ -489,7 +617,315 @@ class CartPoleVectorEnv(VectorEnv):
 
         self.prev_done = np.logical_or(terminated, truncated)
 
-        return self.state.T.astype(np.float32), reward, terminated, truncated, {}
+        return state.T.astype(np.float32), reward, terminated, truncated, {}
+
+    def _step_inplace(
+        self, action: Union[np.ndarray, "torch.Tensor"]
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, dict]:
+        if not isinstance(action, np.ndarray):  # the torch backend
+            action = action.detach().numpy()
+        if self.validate_actions:
+            assert self.action_space.contains(
+                action
+            ), f"{action!r} ({type(action)}) invalid"
+        assert self.state is not None, "Call reset before using step method."
+
+        reward = self._reward
+        terminated = self._terminated
+        truncated = self._truncated
+        self._advance_inplace(action, reward, terminated, truncated)
+
+        if self.backend == "torch":
+            assert self._tensors is not None
+            return *self._tensors, {}
+        return self.state.T, reward, terminated, truncated, {}
+
+    def _advance_inplace(
+        self,
+        action: np.ndarray,
+        reward: np.ndarray,
+        terminated: np.ndarray,
+        truncated: np.ndarray,
+    ) -> None:
+        """Step the in-place state, autoresetting the envs done in the previous
+        step, and write the results into the given buffers."""
+        if self.shard_size is None:
+            self._advance_shard(
+                slice(None), self.np_random, action, reward, terminated, truncated
+            )
+        elif self._executor is None:
+            for shard, rng in zip(self._shards, self._shard_rngs):
+                self._advance_shard(shard, rng, action, reward, terminated, truncated)
+        else:
+            futures = [
+                self._executor.submit(
+                    self._advance_shard,
+                    shard,
+                    rng,
+                    action,
+                    reward,
+                    terminated,
+                    truncated,
+                )
+                for shard, rng in zip(self._shards, self._shard_rngs)
+            ]
+            for future in futures:
+                future.result()
+
+    def _advance_shard(
+        self,
+        shard: slice,
+        rng: np.random.Generator,
+        action: np.ndarray,
+        reward: np.ndarray,
+        terminated: np.ndarray,
+        truncated: np.ndarray,
+    ) -> None:
+        """`_advance_inplace` for the envs in `shard`, resetting them from `rng`."""
+        assert self.state is not None
+        state = self.state[:, shard]
+        steps = self.steps[shard]
+        prev_done = self.prev_done[shard]
+        reward = reward[shard]
+        terminated = terminated[shard]
+        truncated = truncated[shard]
+
+        self._integrate_inplace(
+            state,
+            action[shard],
+            self._work[:, shard],
+            terminated,
+            self._out_of_bounds[shard],
+            shard,
+        )
+
+        steps += 1
+        np.greater_equal(steps, self.max_episode_steps, out=truncated)
+
+        if self._sutton_barto_reward:
+            np.copyto(reward, terminated)
+            np.negative(reward, out=reward)
+        else:
+            reward.fill(1.0)
+
+        # Reset all environments which terminated or were truncated in the last step
+        num_done = np.count_nonzero(prev_done)
+        if num_done:
+            state[:, prev_done] = rng.uniform(
+                low=self.low, high=self.high, size=(4, num_done)
+            )
+            if self.param_distributions:
+                self._resample_params(rng, shard, prev_done)
+            np.copyto(steps, 0, where=prev_done)
+            np.copyto(reward, 0.0, where=prev_done)
+            np.copyto(terminated, False, where=prev_done)
+            np.copyto(truncated, False, where=prev_done)
+
+        np.logical_or(terminated, truncated, out=prev_done)
+
+    def step_n(
+        self, actions: Union[np.ndarray, "torch.Tensor"]
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, dict]:
+        """Advance all envs by `T` steps in one call, autoresetting per env as `step` does.
+
+        Args:
+            actions: Actions of shape `(T, num_envs)`
+
+        Returns:
+            Observations `(T, num_envs, 4)`, rewards, terminations and truncations
+            `(T, num_envs)`. These are views into output buffers that are reused
+            by the next `step_n` call with the same or a smaller `T`.
+        """
+        assert (
+            actions.ndim == 2 and actions.shape[1] == self.num_envs
+        ), f"Expected actions of shape (T, {self.num_envs}), got {actions.shape}"
+        assert self.state is not None, "Call reset before using step_n method."
+        if not isinstance(actions, np.ndarray):  # the torch backend
+            actions = actions.detach().numpy()
+        if not self.inplace or self.validate_actions:
+            assert np.isin(actions, (0, 1)).all(), f"{actions!r} invalid"
+
+        num_steps = len(actions)
+        if self._rollout is None or len(self._rollout[0]) < num_steps:
+            # Observations are kept as (T, 4, num_envs) so that every step is a
+            # contiguous copy of the structure-of-arrays state.
+            self._rollout = (
+                np.empty((num_steps, 4, self.num_envs), dtype=np.float32),
+                np.empty((num_steps, self.num_envs), dtype=np.float32),
+                np.empty((num_steps, self.num_envs), dtype=np.bool_),
+                np.empty((num_steps, self.num_envs), dtype=np.bool_),
+            )
+        states, rewards, terminations, truncations = (
+            buffer[:num_steps] for buffer in self._rollout
+        )
+        observations = states.transpose(0, 2, 1)
+        if self.backend == "torch" and (
+            self._rollout_tensors is None
+            or self._rollout_tensors[1].shape[0] != num_steps
+        ):
+            import torch
+
+            self._rollout_tensors = (
+                torch.from_numpy(observations),
+                torch.from_numpy(rewards),
+                torch.from_numpy(terminations),
+                torch.from_numpy(truncations),
+            )
+
+        for t in range(num_steps):
+            if self.inplace:
+                self._advance_inplace(
+                    actions[t], rewards[t], terminations[t], truncations[t]
+                )
+                states[t] = self.state
+            else:
+                (
+                    observations[t],
+                    rewards[t],
+                    terminations[t],
+                    truncations[t],
+                    _,
+                ) = self.step(actions[t])
+
+        if self.backend == "torch":
+            assert self._rollout_tensors is not None
+            return *self._rollout_tensors, {}
+        return observations, rewards, terminations, truncations, {}
+
+    def _integrate_inplace(
+        self,
+        state: np.ndarray,
+        action: np.ndarray,
+        work: np.ndarray,
+        terminated: np.ndarray,
+        out_of_bounds: np.ndarray,
+        shard: slice = slice(None),
+    ) -> None:
+        """Advance `state` by one step and write the termination flags, using
+        only `out=` ufuncs over the preallocated `work` rows."""
+        x, x_dot, theta, theta_dot = state
+        force, costheta, sintheta, temp, thetaacc, xacc = work
+        force_mag = _shard_of(self.force_mag, shard)
+        tau = _shard_of(self.tau, shard)
+
+        np.multiply(action, force_mag, out=force)
+        force *= 2.0
+        force -= force_mag
+        np.cos(theta, out=costheta)
+        np.sin(theta, out=sintheta)
+
+        # temp = (force + polemass_length * theta_dot**2 * sintheta) / total_mass
+        np.square(theta_dot, out=temp)
+        temp *= sintheta
+        temp *= _shard_of(self.polemass_length, shard)
+        temp += force
+        temp /= _shard_of(self.total_mass, shard)
+
+        # thetaacc = (gravity * sintheta - costheta * temp)
+        #     / (length * (4/3 - masspole * costheta**2 / total_mass))
+        denominator = force  # force is no longer needed
+        np.square(costheta, out=denominator)
+        denominator *= _shard_of(self._masspole_ratio, shard)
+        np.subtract(4.0 / 3.0, denominator, out=denominator)
+        denominator *= _shard_of(self.length, shard)
+        np.multiply(costheta, temp, out=thetaacc)
+        sintheta *= _shard_of(self.gravity, shard)
+        np.subtract(sintheta, thetaacc, out=thetaacc)
+        thetaacc /= denominator
+
+        # xacc = temp - polemass_length * thetaacc * costheta / total_mass
+        np.multiply(thetaacc, costheta, out=xacc)
+        xacc *= _shard_of(self._polemass_length_ratio, shard)
+        np.subtract(temp, xacc, out=xacc)
+
+        delta = costheta  # costheta is no longer needed
+        if self.kinematics_integrator == "euler":
+            np.multiply(x_dot, tau, out=delta)
+            x += delta
+            np.multiply(xacc, tau, out=delta)
+            x_dot += delta
+            np.multiply(theta_dot, tau, out=delta)
+            theta += delta
+            np.multiply(thetaacc, tau, out=delta)
+            theta_dot += delta
+        else:  # semi-implicit euler
+            np.multiply(xacc, tau, out=delta)
+            x_dot += delta
+            np.multiply(x_dot, tau, out=delta)
+            x += delta
+            np.multiply(thetaacc, tau, out=delta)
+            theta_dot += delta
+            np.multiply(theta_dot, tau, out=delta)
+            theta += delta
+
+        np.abs(x, out=delta)
+        np.greater(delta, self.x_threshold, out=terminated)
+        np.abs(theta, out=delta)
+        np.greater(delta, self.theta_threshold_radians, out=out_of_bounds)
+        terminated |= out_of_bounds
+
+    def set_physical_params(self, **params: Union[float, np.ndarray]) -> None:
+        """Set physical parameters, each either a scalar shared by all envs or an
+        array of shape `(num_envs,)`."""
+        dtype = np.float32 if self.inplace else np.float64
+        for name, value in params.items():
+            assert name in PHYSICAL_PARAMS, f"Unknown physical parameter {name!r}"
+            if np.ndim(value) == 0:
+                setattr(self, name, float(value))
+            else:
+                value = np.array(value, dtype=dtype)
+                assert value.shape == (
+                    self.num_envs,
+                ), f"Expected {name} of shape ({self.num_envs},), got {value.shape}"
+                setattr(self, name, value)
+        self._update_derived_params()
+
+    def _resample_params(
+        self, rng: np.random.Generator, shard: slice, mask: np.ndarray
+    ) -> None:
+        """Resample the randomized parameters of the envs selected by `mask` within `shard`."""
+        size = np.count_nonzero(mask)
+        for name, distribution in self.param_distributions.items():
+            getattr(self, name)[shard][mask] = _sample(distribution, rng, size)
+        self._update_derived_params(shard)
+
+    def _update_derived_params(self, shard: slice = slice(None)) -> None:
+        """Recompute the quantities derived from the physical parameters, for the
+        envs in `shard` when they are per-env arrays."""
+        if not any(
+            isinstance(getattr(self, name), np.ndarray) for name in PHYSICAL_PARAMS
+        ):
+            self.total_mass = self.masspole + self.masscart
+            self.polemass_length = self.masspole * self.length
+            self._masspole_ratio = self.masspole / self.total_mass
+            self._polemass_length_ratio = self.polemass_length / self.total_mass
+            return
+
+        if not isinstance(self.total_mass, np.ndarray):
+            dtype = np.float32 if self.inplace else np.float64
+            (
+                self.total_mass,
+                self.polemass_length,
+                self._masspole_ratio,
+                self._polemass_length_ratio,
+            ) = np.empty((4, self.num_envs), dtype=dtype)
+            shard = slice(None)
+
+        # Views into the per-env arrays, which are written in place
+        total_mass, polemass_length, masspole_ratio, polemass_length_ratio = (
+            np.asarray(derived)[shard]
+            for derived in (
+                self.total_mass,
+                self.polemass_length,
+                self._masspole_ratio,
+                self._polemass_length_ratio,
+            )
+        )
+        masspole = _shard_of(self.masspole, shard)
+        np.add(masspole, _shard_of(self.masscart, shard), out=total_mass)
+        np.multiply(masspole, _shard_of(self.length, shard), out=polemass_length)
+        np.divide(masspole, total_mass, out=masspole_ratio)
+        np.divide(polemass_length, total_mass, out=polemass_length_ratio)
 
     def reset(
         self,
@@ -502,13 +938,41 @@ class CartPoleVectorEnv(VectorEnv):
         # state/observations.
         # -0.05 and 0.05 is the default low and high bounds
         self.low, self.high = utils.maybe_parse_reset_bounds(options, -0.05, 0.05)
-        self.state = self.np_random.uniform(
+        state = self.np_random.uniform(
             low=self.low, high=self.high, size=(4, self.num_envs)
         )
         self.steps_beyond_terminated = None
         self.steps = np.zeros(self.num_envs, dtype=np.int32)
         self.prev_done = np.zeros(self.num_envs, dtype=np.bool_)
 
+        if self.param_distributions:
+            self.set_physical_params(
+                **{
+                    name: _sample(distribution, self.np_random, self.num_envs)
+                    for name, distribution in self.param_distributions.items()
+                }
+            )
+
+        if self.inplace:
+            if self.state is None:
+                self.state = np.empty((4, self.num_envs), dtype=np.float32)
+            self.state[...] = state
+            if self.shard_size is not None:
+                self._shard_rngs = self.np_random.spawn(len(self._shards))
+            if self.backend == "torch":
+                if self._tensors is None:
+                    import torch
+
+                    self._tensors = (
+                        torch.from_numpy(self.state).T,
+                        torch.from_numpy(self._reward),
+                        torch.from_numpy(self._terminated),
+                        torch.from_numpy(self._truncated),
+                    )
+                return self._tensors[0], {}
+            return self.state.T, {}
+
+        self.state = state
         return self.state.T.astype(np.float32), {}
 
     def render(self):
@@ -521,6 +985,20 @@ class CartPoleVectorEnv(VectorEnv):
             )
             return
 
+        if self.render_mode == "rgb_array_batch":
+            if self.state is None:
+                raise ValueError(
+                    "Cartpole's state is None, it probably hasn't be reset yet."
+                )
+            if self.rasterizer is None:
+                self.rasterizer = CartPoleRasterizer(
+                    self.num_envs,
+                    self.screen_width,
+                    self.screen_height,
+                    self.x_threshold,
+                )
+            return self.rasterizer.render(self.state[0], self.state[2], self.length)
+
         try:
             import pygame
             from pygame import gfxdraw
@@ -540,7 +1018,6 @@ class CartPoleVectorEnv(VectorEnv):
         world_width = self.x_threshold * 2
         scale = self.screen_width / world_width
         polewidth = 10.0
-        polelen = scale * (2 * self.length)
         cartwidth = 50.0
         cartheight = 30.0
 
@@ -549,8 +1026,10 @@ class CartPoleVectorEnv(VectorEnv):
                 "Cartpole's state is None, it probably hasn't be reset yet."
             )
 
-        for x, screen in zip(self.state.T, self.screens):
+        lengths = np.broadcast_to(self.length, (self.num_envs,))
+        for x, screen, length in zip(self.state.T, self.screens, lengths):
             assert isinstance(x, np.ndarray) and x.shape == (4,)
+            polelen = scale * (2 * length)
 
             self.surf = pygame.Surface((self.screen_width, self.screen_height))
             self.surf.fill((255, 255, 255))
@@ -605,7 +1084,27 @@ class CartPoleVectorEnv(VectorEnv):
         ]
 
     def close(self):
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
         if self.screens is not None:
             import pygame
 
             pygame.quit()
+
+
+def _shard_of(
+    value: Union[float, np.ndarray], shard: slice
+) -> Union[float, np.ndarray]:
+    """The part of a per-env parameter that belongs to `shard`."""
+    return value[shard] if isinstance(value, np.ndarray) else value
+
+
+def _sample(
+    distribution: ParamDistribution, rng: np.random.Generator, size: int
+) -> np.ndarray:
+    if callable(distribution):
+        return np.asarray(distribution(rng, size))
+    low, high = distribution
+    return rng.uniform(low, high, size=size)
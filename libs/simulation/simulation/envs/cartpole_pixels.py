@@ -0,0 +1,196 @@
+"""Pixel-observation variants of the cart-pole environments.
+
+Observations are small frames rasterized straight from the state with
+`CartPoleRasterizer`, instead of rendering at 600x400 and downsampling. With
+`frame_stack=k` the last `k` frames are stacked on a leading axis, the most
+recent one last, so an observation has shape `(k, H, W)` in grayscale or
+`(k, H, W, 3)` in RGB.
+"""
+
+from typing import TYPE_CHECKING, Optional, Tuple, Union
+
+import numpy as np
+from gymnasium import spaces
+from gymnasium.vector.utils import batch_space
+
+from simulation.envs.cartpole import CartPoleEnv, CartPoleVectorEnv
+from simulation.envs.cartpole_rendering import CartPoleRasterizer
+
+if TYPE_CHECKING:
+    import torch
+
+
+def _frame_stack_space(
+    width: int, height: int, grayscale: bool, frame_stack: int
+) -> spaces.Box:
+    shape = (
+        (frame_stack, height, width) if grayscale else (frame_stack, height, width, 3)
+    )
+    return spaces.Box(0, 255, shape=shape, dtype=np.uint8)
+
+
+class CartPolePixelEnv(CartPoleEnv):
+    """`CartPoleEnv` whose observations are stacked low-resolution frames."""
+
+    def __init__(
+        self,
+        width: int = 84,
+        height: int = 84,
+        grayscale: bool = True,
+        frame_stack: int = 1,
+        sutton_barto_reward: bool = False,
+        render_mode: Optional[str] = None,
+    ):
+        super().__init__(
+            sutton_barto_reward=sutton_barto_reward, render_mode=render_mode
+        )
+
+        self.observation_space = _frame_stack_space(
+            width, height, grayscale, frame_stack
+        )
+        self.rasterizer = CartPoleRasterizer(
+            1, width, height, self.x_threshold, grayscale
+        )
+        self.frames = np.zeros(self.observation_space.shape, dtype=np.uint8)
+
+    def _draw(self) -> np.ndarray:
+        assert self.state is not None
+        return self.rasterizer.render(self.state[0:1], self.state[2:3], self.length)[0]
+
+    def step(self, action):
+        _, reward, terminated, truncated, info = super().step(action)
+
+        self.frames[:-1] = self.frames[1:]
+        self.frames[-1] = self._draw()
+
+        return self.frames.copy(), reward, terminated, truncated, info
+
+    def reset(
+        self,
+        *,
+        seed: Optional[int] = None,
+        options: Optional[dict] = None,
+    ):
+        _, info = super().reset(seed=seed, options=options)
+
+        self.frames[:] = self._draw()
+
+        return self.frames.copy(), info
+
+
+class CartPolePixelVectorEnv(CartPoleVectorEnv):
+    """`CartPoleVectorEnv` whose observations are stacked low-resolution frames.
+
+    Autoreset envs start their new episode with the stack filled by the first frame.
+    In `inplace` mode the returned observations are a view of the stack buffer that
+    the next step overwrites, otherwise they are a copy. `step_n` calls `step` once
+    per step, as the frames are drawn from the state after every step.
+    """
+
+    def __init__(
+        self,
+        num_envs: int = 1,
+        width: int = 84,
+        height: int = 84,
+        grayscale: bool = True,
+        frame_stack: int = 1,
+        max_episode_steps: int = 500,
+        render_mode: Optional[str] = None,
+        sutton_barto_reward: bool = False,
+        inplace: bool = False,
+        validate_actions: bool = False,
+        shard_size: Optional[int] = None,
+        num_threads: int = 1,
+    ):
+        super().__init__(
+            num_envs=num_envs,
+            max_episode_steps=max_episode_steps,
+            render_mode=render_mode,
+            sutton_barto_reward=sutton_barto_reward,
+            inplace=inplace,
+            validate_actions=validate_actions,
+            shard_size=shard_size,
+            num_threads=num_threads,
+        )
+
+        self.single_observation_space = _frame_stack_space(
+            width, height, grayscale, frame_stack
+        )
+        self.observation_space = batch_space(self.single_observation_space, num_envs)
+        self.pixel_rasterizer = CartPoleRasterizer(
+            num_envs, width, height, self.x_threshold, grayscale
+        )
+        self.frames = np.zeros(
+            (num_envs, *self.single_observation_space.shape), dtype=np.uint8
+        )
+        self._was_done = np.zeros(num_envs, dtype=np.bool_)
+        self._pixel_rollout: Optional[tuple] = None
+
+    def _draw(self) -> np.ndarray:
+        assert self.state is not None
+        return self.pixel_rasterizer.render(self.state[0], self.state[2], self.length)
+
+    def step(
+        self, action: Union[np.ndarray, "torch.Tensor"]
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, dict]:
+        # Envs done in the previous step are reset by this one
+        np.copyto(self._was_done, self.prev_done)
+        _, reward, terminated, truncated, info = super().step(action)
+
+        frame = self._draw()
+        self.frames[:, :-1] = self.frames[:, 1:]
+        self.frames[:, -1] = frame
+        if self._was_done.any():
+            self.frames[self._was_done] = frame[self._was_done][:, None]
+
+        obs = self.frames if self.inplace else self.frames.copy()
+        return obs, reward, terminated, truncated, info
+
+    def step_n(
+        self, actions: Union[np.ndarray, "torch.Tensor"]
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, dict]:
+        """Advance all envs by `T` steps in one call, autoresetting per env as `step` does.
+
+        Args:
+            actions: Actions of shape `(T, num_envs)`
+
+        Returns:
+            Observations `(T, num_envs, k, H, W[, 3])`, rewards, terminations and
+            truncations `(T, num_envs)`. These are views into output buffers that
+            are reused by the next `step_n` call with the same or a smaller `T`.
+        """
+        num_steps = len(actions)
+        if self._pixel_rollout is None or len(self._pixel_rollout[0]) < num_steps:
+            self._pixel_rollout = (
+                np.empty((num_steps, *self.frames.shape), dtype=np.uint8),
+                np.empty((num_steps, self.num_envs), dtype=np.float32),
+                np.empty((num_steps, self.num_envs), dtype=np.bool_),
+                np.empty((num_steps, self.num_envs), dtype=np.bool_),
+            )
+        observations, rewards, terminations, truncations = (
+            buffer[:num_steps] for buffer in self._pixel_rollout
+        )
+
+        for t in range(num_steps):
+            (
+                observations[t],
+                rewards[t],
+                terminations[t],
+                truncations[t],
+                _,
+            ) = self.step(actions[t])
+
+        return observations, rewards, terminations, truncations, {}
+
+    def reset(
+        self,
+        *,
+        seed: Optional[int] = None,
+        options: Optional[dict] = None,
+    ):
+        _, info = super().reset(seed=seed, options=options)
+
+        self.frames[:] = self._draw()[:, None]
+
+        obs = self.frames if self.inplace else self.frames.copy()
+        return obs, info
@@ -0,0 +1,133 @@
+"""Batched cart-pole rasterizer implemented with NumPy only.
+
+The scene matches `CartPoleEnv.render`: a white background, the track line, a
+black cart, the pole and its axle. Geometry is defined on the 600x400 canvas used
+by pygame and scaled to the requested frame size, so the same class serves full
+size video frames and small pixel observations.
+"""
+
+from typing import Union
+
+import numpy as np
+
+CANVAS_WIDTH = 600
+CANVAS_HEIGHT = 400
+
+POLE_WIDTH = 10.0
+CART_WIDTH = 50.0
+CART_HEIGHT = 30.0
+CART_Y = 100.0  # TOP OF CART
+AXLE_OFFSET = CART_HEIGHT / 4.0
+
+# Palette indexed by the layer labels drawn in `CartPoleRasterizer.render`
+BACKGROUND, CART, POLE, AXLE = 0, 1, 2, 3
+PALETTE = np.array(
+    [(255, 255, 255), (0, 0, 0), (202, 152, 101), (129, 132, 203)], dtype=np.uint8
+)
+# ITU-R 601-2 luma of the palette, as used by `PIL.Image.convert("L")`
+GRAY_PALETTE = np.round(PALETTE @ np.array([0.299, 0.587, 0.114])).astype(np.uint8)
+
+
+class CartPoleRasterizer:
+    """Draws `num_envs` cart-poles at once into a preallocated `(N, H, W, 3)` array,
+    or `(N, H, W)` with `grayscale=True`.
+
+    Only a window around every cart is evaluated, all envs together: pixel centers
+    are transformed into the pole frame and tested against the cart, pole and axle
+    shapes, and the covered pixels are scattered into the frames.
+    """
+
+    def __init__(
+        self,
+        num_envs: int,
+        width: int = CANVAS_WIDTH,
+        height: int = CANVAS_HEIGHT,
+        x_threshold: float = 2.4,
+        grayscale: bool = False,
+    ):
+        self.num_envs = num_envs
+        self.width = width
+        self.height = height
+        self.x_threshold = x_threshold
+        self.grayscale = grayscale
+        self.palette = GRAY_PALETTE if grayscale else PALETTE
+
+        self.scale_x = width / CANVAS_WIDTH
+        self.scale_y = height / CANVAS_HEIGHT
+        self.world_scale = CANVAS_WIDTH / (x_threshold * 2)
+
+        frame_shape = (height, width) if grayscale else (height, width, 3)
+        self.frames = np.empty((num_envs, *frame_shape), dtype=np.uint8)
+
+        self.background = np.empty(frame_shape, dtype=np.uint8)
+        self.background[...] = self.palette[BACKGROUND]
+        self.track_row = min(
+            height - 1, int((CANVAS_HEIGHT - 1 - CART_Y) * self.scale_y)
+        )
+        self.background[self.track_row] = self.palette[CART]
+
+    def render(
+        self, x: np.ndarray, theta: np.ndarray, length: Union[float, np.ndarray] = 0.5
+    ) -> np.ndarray:
+        """Draw the cart-poles and return the frame buffer, which the next call overwrites.
+
+        Args:
+            x: Cart positions of shape `(N,)`
+            theta: Pole angles of shape `(N,)`
+            length: Half pole length, either shared or per env
+
+        Returns:
+            The `(N, H, W, 3)` or `(N, H, W)` uint8 frames
+        """
+        polelen = self.world_scale * (2 * np.asarray(length, dtype=np.float32))
+        cartx = np.asarray(x, dtype=np.float32) * self.world_scale + CANVAS_WIDTH / 2.0
+        axle_y = CART_Y + AXLE_OFFSET
+
+        # Window around the axle that covers the cart and the pole at any angle
+        reach = max(float(np.max(polelen)), CART_WIDTH) + POLE_WIDTH
+        top = max(0, int((CANVAS_HEIGHT - axle_y - reach) * self.scale_y))
+        bottom = min(
+            self.height, int((CANVAS_HEIGHT - axle_y + reach) * self.scale_y) + 2
+        )
+        window_width = min(self.width, int(2 * reach * self.scale_x) + 2)
+        left = np.clip(
+            ((cartx - reach) * self.scale_x).astype(np.int64),
+            0,
+            self.width - window_width,
+        )
+
+        # Pixel centers relative to the axle, on the 600x400 canvas with y up
+        rows = np.arange(top, bottom, dtype=np.float32)
+        cols = np.arange(window_width, dtype=np.float32)
+        dy = (CANVAS_HEIGHT - (rows + 0.5) / self.scale_y - axle_y)[None, :, None]
+        dx = ((left[:, None] + cols + 0.5) / self.scale_x - cartx[:, None])[:, None, :]
+
+        # The pole is rotated by -theta, so rotate the pixels by theta into its frame
+        costheta = np.cos(theta).astype(np.float32)[:, None, None]
+        sintheta = np.sin(theta).astype(np.float32)[:, None, None]
+        u = costheta * dx - sintheta * dy
+        v = sintheta * dx + costheta * dy
+
+        labels = np.zeros(u.shape, dtype=np.uint8)
+        labels[
+            (np.abs(dx) <= CART_WIDTH / 2)
+            & (dy >= -CART_HEIGHT / 2 - AXLE_OFFSET)
+            & (dy <= CART_HEIGHT / 2 - AXLE_OFFSET)
+        ] = CART
+        polelen = np.broadcast_to(polelen, (self.num_envs,))[:, None, None]
+        labels[
+            (np.abs(u) <= POLE_WIDTH / 2)
+            & (v >= -POLE_WIDTH / 2)
+            & (v <= polelen - POLE_WIDTH / 2)
+        ] = POLE
+        labels[np.square(dx) + np.square(dy) <= (POLE_WIDTH / 2) ** 2] = AXLE
+
+        np.copyto(self.frames, self.background)
+        env, row, col = labels.nonzero()
+        self.frames[env, top + row, left[env] + col] = self.palette[
+            labels[env, row, col]
+        ]
+        # The track line is drawn over everything, as in `CartPoleEnv.render`
+        self.frames[:, self.track_row] = self.palette[CART]
+
+        return self.frames
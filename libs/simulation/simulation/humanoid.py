@@ -1,10 +1,10 @@
 import os
-import time
 
 import mujoco
-import mujoco.viewer
 from huggingface_hub import hf_hub_download
 
+from simulation.realtime import SimulationRunner
+
 m = mujoco.MjModel.from_xml_path(f"{os.path.dirname(__file__)}/models/humanoid.xml")
 # m = mujoco.MjModel.from_xml_path(
 #     f"{os.path.dirname(__file__)}/envs/assets/kxr_l2_humanoid.xml"
@@ -32,23 +32,10 @@ def run():
     pass
 
 
-def view():
-    with mujoco.viewer.launch_passive(m, d) as viewer:
-        while viewer.is_running():
-            step_start = time.time()
-
-            # mj_step can be replaced with code that also evaluates a policy
-            # and applies a control signal before stepping the physics.
-            mujoco.mj_step(m, d)
-
-            # Pick up changes to the physics state,
-            # apply perturbations, update options from GUI.
-            viewer.sync()
-
-            # Rudimentary time keeping, will drift relative to wall clock.
-            time_until_next_step = m.opt.timestep - (time.time() - step_start)
-            if time_until_next_step > 0:
-                time.sleep(time_until_next_step)
+def view(realtime_factor=1.0):
+    # SimulationRunner can be given a controller that evaluates a policy and
+    # applies a control signal before every physics step.
+    SimulationRunner(m, d, realtime_factor=realtime_factor).run()
 
 
 if __name__ == "__main__":
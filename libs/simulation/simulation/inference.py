@@ -0,0 +1,84 @@
+"""Low-latency inference for the small MLP policies and Q-networks.
+
+Acting calls a network on a handful of observations at a time, where the cost of
+eager PyTorch is mostly Python dispatch and autograd bookkeeping rather than
+arithmetic. `NumpyMLP` evaluates a stack of `nn.Linear` layers with one NumPy
+matmul per layer instead, into output buffers that are reused across calls.
+
+The weights are NumPy views of the module parameters, not copies, so in-place
+optimizer steps and `load_state_dict` are picked up without any refresh.
+"""
+
+from typing import Optional, Sequence
+
+import numpy as np
+from torch import nn
+
+
+def _relu(x: np.ndarray) -> None:
+    np.maximum(x, 0.0, out=x)
+
+
+def _tanh(x: np.ndarray) -> None:
+    np.tanh(x, out=x)
+
+
+def _softplus(x: np.ndarray) -> None:
+    # log(1 + exp(x)) without overflow for large x
+    np.logaddexp(0.0, x, out=x)
+
+
+ACTIVATIONS = {"relu": _relu, "tanh": _tanh, "softplus": _softplus}
+
+
+class NumpyMLP:
+    """Evaluates `linears` in sequence, each followed by its activation.
+
+    Args:
+        linears: The layers, which must be on the CPU in float32
+        activations: Name of the activation after every layer, one of `ACTIVATIONS`,
+            or `None` for none
+        max_batch_size: Batch size the buffers are allocated for, they grow on
+            demand for larger batches
+
+    The array returned by a call is a view of a buffer that the next call
+    overwrites, and an instance must not be called from several threads at once.
+    """
+
+    def __init__(
+        self,
+        linears: Sequence[nn.Linear],
+        activations: Sequence[Optional[str]],
+        max_batch_size: int = 1,
+    ):
+        assert len(linears) == len(activations)
+        # `W.T` is a Fortran-ordered view, which BLAS reads without a transposed copy
+        self.weights = [linear.weight.detach().numpy().T for linear in linears]
+        self.biases = [linear.bias.detach().numpy() for linear in linears]
+        self.activations = [
+            ACTIVATIONS[name] if name is not None else None for name in activations
+        ]
+        self._allocate(max_batch_size)
+
+    def _allocate(self, batch_size: int) -> None:
+        self.buffers = [
+            np.empty((batch_size, weight.shape[1]), dtype=np.float32)
+            for weight in self.weights
+        ]
+
+    def __call__(self, x: np.ndarray) -> np.ndarray:
+        """Outputs of shape `(B, out)` for inputs of shape `(B, in)`."""
+        batch_size = len(x)
+        if batch_size > len(self.buffers[0]):
+            self._allocate(batch_size)
+
+        for weight, bias, activation, buffer in zip(
+            self.weights, self.biases, self.activations, self.buffers
+        ):
+            out = buffer[:batch_size]
+            np.matmul(x, weight, out=out)
+            out += bias
+            if activation is not None:
+                activation(out)
+            x = out
+        return x
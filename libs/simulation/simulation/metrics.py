@@ -0,0 +1,231 @@
+"""Streaming training metrics stored as Parquet, and downsampled plots of them.
+
+`MetricsRecorder` appends rows into fixed-size column buffers and writes each
+full buffer as one Parquet row group, so a run of any length holds at most
+`batch_size` rows in memory and a crash loses at most that many. `downsample`
+reads a metrics file one row group at a time and keeps the minimum and maximum
+of every bucket of the x axis, which preserves spikes and dips while bounding
+the number of plotted points.
+"""
+
+import os
+from typing import Optional
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+
+class MetricsRecorder:
+    """Writes rows of named scalar metrics to the Parquet file at `path`.
+
+    The columns and their dtypes are fixed by the first `log` or `log_batch`
+    call. Use as a context manager, or call `close` to write the remaining rows
+    and the file footer.
+    """
+
+    def __init__(self, path: str, batch_size: int = 65_536):
+        self.path = path
+        self.batch_size = batch_size
+
+        self.columns: Optional[dict[str, np.ndarray]] = None
+        self.num_rows = 0  # rows in the buffers
+        self.writer: Optional[pq.ParquetWriter] = None
+
+    def _allocate(self, values: dict) -> None:
+        self.columns = {
+            name: np.empty(self.batch_size, dtype=np.asarray(value).dtype)
+            for name, value in values.items()
+        }
+
+    def log(self, **values) -> None:
+        """Append one row, e.g. `log(episode=i, reward=r)`."""
+        if self.columns is None:
+            self._allocate(values)
+        assert self.columns is not None
+
+        for name, column in self.columns.items():
+            column[self.num_rows] = values[name]
+        self.num_rows += 1
+        if self.num_rows == self.batch_size:
+            self.flush()
+
+    def log_batch(self, **columns: np.ndarray) -> None:
+        """Append one row per element of equally long arrays, e.g. the envs of a
+        vector env step."""
+        if self.columns is None:
+            self._allocate({name: column[:0] for name, column in columns.items()})
+        assert self.columns is not None
+
+        size = len(next(iter(columns.values())))
+        start = 0
+        while start < size:
+            n = min(size - start, self.batch_size - self.num_rows)
+            for name, column in self.columns.items():
+                column[self.num_rows : self.num_rows + n] = columns[name][
+                    start : start + n
+                ]
+            self.num_rows += n
+            start += n
+            if self.num_rows == self.batch_size:
+                self.flush()
+
+    def _batch(self) -> pa.RecordBatch:
+        assert self.columns is not None
+        return pa.record_batch(
+            [pa.array(column[: self.num_rows]) for column in self.columns.values()],
+            names=list(self.columns),
+        )
+
+    def _open(self, schema: pa.Schema) -> pq.ParquetWriter:
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        return pq.ParquetWriter(self.path, schema)
+
+    def flush(self) -> None:
+        """Write the buffered rows as a row group."""
+        if self.columns is None or self.num_rows == 0:
+            return
+
+        batch = self._batch()
+        if self.writer is None:
+            self.writer = self._open(batch.schema)
+        self.writer.write_batch(batch)
+        self.num_rows = 0
+
+    def close(self) -> None:
+        """Write the remaining rows and the footer. A recorder whose columns are
+        known but that never wrote a row still writes a file, with no rows."""
+        self.flush()
+        if self.writer is None and self.columns is not None:
+            self.writer = self._open(self._batch().schema)
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+    def __enter__(self) -> "MetricsRecorder":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+def downsample(
+    path: str,
+    x: str,
+    y: str,
+    group: Optional[str] = None,
+    num_buckets: int = 1_000,
+):
+    """Min/max downsampling of the `y` column of a metrics file over `x`.
+
+    The range of `x` is split into `num_buckets` equal buckets, separately for
+    every value of the `group` column, and each bucket is reduced to the rows
+    with its minimum and maximum `y`. Only one row group is in memory at a time.
+
+    Args:
+        path: Parquet file written by `MetricsRecorder`
+        x: Column of the x axis, e.g. the episode
+        y: Column to plot
+        group: Optional column that splits the data into separate lines, e.g. the seed
+        num_buckets: Number of buckets per group, at most twice as many rows are kept
+
+    Returns:
+        A polars DataFrame with the `x`, `y` and `group` columns, sorted by `x`
+    """
+    import polars as pl
+
+    file = pq.ParquetFile(path)
+    columns = [x, y] if group is None else [x, y, group]
+    if file.metadata.num_rows == 0:
+        return pl.from_arrow(file.schema_arrow.empty_table().select(columns))
+
+    # The x range, for the bucket edges, from the row group statistics
+    x_index = file.schema_arrow.get_field_index(x)
+    x_dtype = file.schema_arrow.field(x).type.to_pandas_dtype()
+    x_min = min(
+        file.metadata.row_group(i).column(x_index).statistics.min
+        for i in range(file.num_row_groups)
+    )
+    x_max = max(
+        file.metadata.row_group(i).column(x_index).statistics.max
+        for i in range(file.num_row_groups)
+    )
+    bucket_width = max(x_max - x_min, 1e-12) / num_buckets
+
+    # Per group, the x and y of the minimum and maximum of every bucket
+    lows: dict = {}
+    highs: dict = {}
+    for row_group in range(file.num_row_groups):
+        table = file.read_row_group(row_group, columns=columns)
+        xs = table.column(x).to_numpy()
+        ys = table.column(y).to_numpy().astype(np.float64)
+        groups = (
+            table.column(group).to_numpy()
+            if group is not None
+            else np.zeros(len(xs), dtype=np.int64)
+        )
+        buckets = np.minimum(
+            ((xs - x_min) / bucket_width).astype(np.int64), num_buckets - 1
+        )
+
+        for key in np.unique(groups):
+            in_group = groups == key
+            gx, gy, gb = xs[in_group], ys[in_group], buckets[in_group]
+
+            # Sorted by bucket then y, the first and last row of a bucket are
+            # its minimum and maximum
+            order = np.lexsort((gy, gb))
+            sorted_buckets = gb[order]
+            starts = np.flatnonzero(np.diff(sorted_buckets, prepend=-1))
+            ends = np.append(starts[1:], len(order)) - 1
+            bucket = sorted_buckets[starts]
+
+            for extremes, rows, better in (
+                (lows, order[starts], np.less),
+                (highs, order[ends], np.greater),
+            ):
+                if key not in extremes:
+                    extremes[key] = (
+                        np.full(num_buckets, np.nan),
+                        np.full(num_buckets, np.nan),
+                    )
+                ex, ey = extremes[key]
+                update = np.isnan(ey[bucket]) | better(gy[rows], ey[bucket])
+                ex[bucket[update]] = gx[rows][update]
+                ey[bucket[update]] = gy[rows][update]
+
+    frames = []
+    for key in lows:
+        xs = np.concatenate([lows[key][0], highs[key][0]])
+        ys = np.concatenate([lows[key][1], highs[key][1]])
+        keep = ~np.isnan(ys)
+        frame = pl.DataFrame({x: xs[keep].astype(x_dtype), y: ys[keep]})
+        if group is not None:
+            frame = frame.with_columns(pl.Series(group, np.full(len(frame), key)))
+        frames.append(frame.unique(subset=[x], keep="first"))
+
+    return pl.concat(frames).sort(x)
+
+
+def plot(
+    path: str,
+    x: str,
+    y: str,
+    group: Optional[str] = None,
+    num_buckets: int = 1_000,
+) -> None:
+    """Show a line chart of a metrics file in the browser, downsampled with
+    `downsample`. Prints a message instead when the file is missing or empty."""
+    import altair as alt
+
+    # No file when nothing was ever logged, e.g. no episode ended
+    if not os.path.exists(path) or pq.ParquetFile(path).metadata.num_rows == 0:
+        print(f"No metrics to plot in {path}")
+        return
+
+    alt.renderers.enable("browser")
+    df = downsample(path, x, y, group, num_buckets)
+    if group is None:
+        df.plot.line(x=x, y=y).show()
+    else:
+        df.plot.line(x=x, y=y, color=f"{group}:N").show()
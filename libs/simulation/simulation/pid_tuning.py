@@ -0,0 +1,166 @@
+"""Headless tuning of the `PIDController` gains of `cartpole.pid`.
+
+The model is loaded once, and every gain triple is simulated from the same
+tilted start on an `MjData` taken from a pool with one instance per thread.
+Threads evaluate chunks of triples in parallel. `mj_step` releases the GIL, but
+the controller and the bookkeeping of every step hold it, about a sixth of the
+time per step for this small model, so the speedup flattens out well below the
+number of threads. Each triple is scored by
+
+    cost = settle_time + effort_weight * effort
+
+where `settle_time` is when the pole last left `settle_tolerance` radians of
+upright, and `effort` is the integral of the squared, clipped control. Triples
+that let the pole fall cost `inf`.
+
+Run with `uv run python -m simulation.pid_tuning`.
+"""
+
+import itertools
+import os
+import queue
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import mujoco
+import numpy as np
+
+from simulation.cartpole import PIDController
+
+MODEL_PATH = f"{os.path.dirname(__file__)}/models/inverted_pendulum.xml"
+
+
+class DataPool:
+    """A fixed set of `MjData` of one model, borrowed with `get` and returned
+    with `put`, so that threads never share one."""
+
+    def __init__(self, model, size):
+        self._pool = queue.Queue()
+        for _ in range(size):
+            self._pool.put(mujoco.MjData(model))
+
+    def get(self):
+        return self._pool.get()
+
+    def put(self, data):
+        self._pool.put(data)
+
+
+def evaluate(
+    model,
+    data,
+    gains,
+    duration=5.0,
+    initial_angle=0.1,
+    settle_tolerance=0.01,
+    fall_angle=1.0,
+    effort_weight=0.01,
+):
+    """Simulate one gain triple from rest with the pole at `initial_angle`.
+
+    Args:
+        model: The inverted pendulum model
+        data: `MjData` of `model`, reset before use
+        gains: `(Kp, Ki, Kd)`
+        duration: Simulated seconds
+        initial_angle: Initial pole angle in radians
+        settle_tolerance: Angle in radians within which the pole counts as upright
+        fall_angle: Angle in radians at which the pole counts as fallen
+        effort_weight: Weight of the control effort in the cost
+
+    Returns:
+        `(cost, settle_time, effort)`
+    """
+    mujoco.mj_resetData(model, data)
+    data.qpos[1] = initial_angle
+    mujoco.mj_forward(model, data)
+
+    time_step = model.opt.timestep
+    low, high = model.actuator_ctrlrange[0]
+    controller = PIDController(*gains, time_step)
+
+    num_steps = round(duration / time_step)
+    settle_time = 0.0
+    effort = 0.0
+    for step in range(num_steps):
+        controller(model, data)
+        ctrl = min(max(data.ctrl[0], low), high)
+        effort += ctrl * ctrl * time_step
+        mujoco.mj_step(model, data)
+
+        angle = abs(data.qpos[1])
+        if angle > fall_angle:
+            return np.inf, np.inf, effort
+        if angle > settle_tolerance:
+            settle_time = (step + 1) * time_step
+
+    # Never settled within the run
+    if settle_time >= num_steps * time_step:
+        return np.inf, settle_time, effort
+    return settle_time + effort_weight * effort, settle_time, effort
+
+
+def sweep(gains, num_threads=None, chunk_size=64, **kwargs):
+    """Evaluate every gain triple of `gains` with `evaluate`.
+
+    Args:
+        gains: Array of shape `(K, 3)` of `(Kp, Ki, Kd)`
+        num_threads: Worker threads, one `MjData` each, the CPU count by default
+        chunk_size: Triples evaluated per task
+        **kwargs: Passed to `evaluate`
+
+    Returns:
+        Arrays `cost`, `settle_time` and `effort` of shape `(K,)`
+    """
+    gains = np.asarray(gains, dtype=np.float64)
+    num_threads = num_threads or os.cpu_count() or 1
+    model = mujoco.MjModel.from_xml_path(MODEL_PATH)
+    pool = DataPool(model, num_threads)
+    results = np.empty((len(gains), 3))
+
+    def run_chunk(start):
+        data = pool.get()
+        try:
+            for i in range(start, min(start + chunk_size, len(gains))):
+                results[i] = evaluate(model, data, gains[i], **kwargs)
+        finally:
+            pool.put(data)
+
+    with ThreadPoolExecutor(num_threads) as executor:
+        # Consume the iterator so that exceptions of the tasks are raised
+        list(executor.map(run_chunk, range(0, len(gains), chunk_size)))
+
+    return results[:, 0], results[:, 1], results[:, 2]
+
+
+def grid(Kp, Ki, Kd):
+    """All combinations of the given gain values, as an array of shape `(K, 3)`."""
+    return np.array(list(itertools.product(Kp, Ki, Kd)), dtype=np.float64)
+
+
+def main(num_threads=None, top=10):
+    gains = grid(
+        Kp=np.geomspace(10, 10_000, 16),
+        Ki=np.concatenate([[0.0], np.geomspace(10, 10_000, 15)]),
+        Kd=np.concatenate([[0.0], np.geomspace(1, 1_000, 15)]),
+    )
+
+    start = time.perf_counter()
+    cost, settle_time, effort = sweep(gains, num_threads)
+    elapsed = time.perf_counter() - start
+    print(
+        f"{len(gains)} gain triples in {elapsed:.1f}s"
+        f" ({len(gains) / elapsed:,.0f} triples/s),"
+        f" {np.isfinite(cost).sum()} settled"
+    )
+
+    for i in np.argsort(cost)[:top]:
+        Kp, Ki, Kd = gains[i]
+        print(
+            f"Kp={Kp:>8.1f} Ki={Ki:>8.1f} Kd={Kd:>7.1f}"
+            f"  cost={cost[i]:.3f} settle={settle_time[i]:.2f}s effort={effort[i]:.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
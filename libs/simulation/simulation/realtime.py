@@ -0,0 +1,143 @@
+"""Run a MuJoCo simulation at a fixed speed relative to the wall clock, with the
+passive viewer synced from its own thread.
+
+`SimulationRunner` steps the physics against an absolute schedule: step `n` is
+due at `start + n * timestep / realtime_factor`, so the time spent in the
+controller, in `mj_step` and in oversleeping is absorbed by the next sleep
+instead of accumulating as drift. The viewer is synced at `fps` by a separate
+thread, so rendering neither slows down the physics nor runs once per physics
+step. Without a `realtime_factor` the physics runs as fast as it can.
+"""
+
+import contextlib
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+import mujoco
+
+
+@dataclass
+class RunStats:
+    steps: int = 0
+    sim_time: float = 0.0  # seconds of simulated time
+    wall_time: float = 0.0  # seconds of wall-clock time
+    max_lag: float = 0.0  # largest delay of a step behind its deadline
+    late_steps: int = 0  # steps over timestep / realtime_factor late
+
+    @property
+    def realtime_factor(self) -> float:
+        return self.sim_time / self.wall_time if self.wall_time > 0 else 0.0
+
+
+class SimulationRunner:
+    """Steps `data` of `model`, calling `controller(model, data)` before each step.
+
+    Args:
+        model: The MuJoCo model
+        data: The data to step
+        controller: Sets `data.ctrl` from the current state, or None
+        realtime_factor: Simulated seconds per wall-clock second, None to run
+            as fast as possible
+        fps: Rate at which the viewer is synced
+        max_lag: When the physics falls this many seconds behind schedule, the
+            schedule restarts from the current step instead of catching up in
+            a burst of unpaced steps
+    """
+
+    def __init__(
+        self,
+        model: mujoco.MjModel,
+        data: mujoco.MjData,
+        controller: Optional[Callable[[mujoco.MjModel, mujoco.MjData], None]] = None,
+        realtime_factor: Optional[float] = 1.0,
+        fps: float = 60.0,
+        max_lag: float = 0.1,
+    ):
+        self.model = model
+        self.data = data
+        self.controller = controller
+        self.realtime_factor = realtime_factor
+        self.fps = fps
+        self.max_lag = max_lag
+
+    def run(self, duration: Optional[float] = None, viewer: bool = True) -> RunStats:
+        """Run for `duration` simulated seconds, or until the viewer is closed.
+
+        Args:
+            duration: Simulated seconds to run, None to run until the viewer is
+                closed
+            viewer: Whether to show the passive viewer
+
+        Returns:
+            Timing statistics of the run
+        """
+        if not viewer:
+            if duration is None:
+                raise ValueError("a run without the viewer needs a duration")
+            return self._run(duration, None)
+
+        import mujoco.viewer
+
+        with mujoco.viewer.launch_passive(self.model, self.data) as handle:
+            stop = threading.Event()
+            syncer = threading.Thread(
+                target=self._sync, args=(handle, stop), daemon=True
+            )
+            syncer.start()
+            try:
+                return self._run(duration, handle)
+            finally:
+                stop.set()
+                syncer.join()
+
+    def _sync(self, handle, stop: threading.Event) -> None:
+        """Viewer thread: sync at `fps` against its own absolute schedule."""
+        period = 1.0 / self.fps
+        deadline = time.perf_counter()
+        while not stop.is_set() and handle.is_running():
+            # Copies the state to the viewer and applies the GUI perturbations,
+            # under the viewer lock that the physics steps hold as well
+            handle.sync()
+            deadline += period
+            delay = deadline - time.perf_counter()
+            if delay > 0:
+                stop.wait(delay)
+            else:
+                deadline = time.perf_counter()
+
+    def _run(self, duration: Optional[float], handle) -> RunStats:
+        model, data = self.model, self.data
+        timestep = model.opt.timestep
+        end_time = None if duration is None else data.time + duration
+        period = None if not self.realtime_factor else timestep / self.realtime_factor
+
+        stats = RunStats()
+        start = time.perf_counter()
+        schedule_start, schedule_step = start, 0
+        while end_time is None or data.time < end_time - 0.5 * timestep:
+            if handle is not None and not handle.is_running():
+                break
+
+            if period is not None:
+                deadline = schedule_start + (stats.steps - schedule_step) * period
+                lag = time.perf_counter() - deadline
+                if lag < 0:
+                    time.sleep(-lag)
+                else:
+                    stats.max_lag = max(stats.max_lag, lag)
+                    stats.late_steps += lag > period
+                    if lag > self.max_lag:
+                        schedule_start, schedule_step = time.perf_counter(), stats.steps
+
+            lock = handle.lock() if handle is not None else contextlib.nullcontext()
+            with lock:
+                if self.controller is not None:
+                    self.controller(model, data)
+                mujoco.mj_step(model, data)
+            stats.steps += 1
+
+        stats.sim_time = stats.steps * timestep
+        stats.wall_time = time.perf_counter() - start
+        return stats
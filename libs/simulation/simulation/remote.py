@@ -0,0 +1,400 @@
+"""Rollout workers that stream transitions to a learner over TCP.
+
+A `RolloutWorker` steps a vector env, on this or another host, with a local
+copy of the policy and sends batches of transitions to a `RolloutServer`. The
+server answers every batch with the policy weights when the worker's version is
+behind, and with an empty acknowledgement otherwise, so weights are pushed
+back on a version counter without a second connection.
+
+Messages are NumPy arrays in a compact binary framing: a `kind` byte and an
+array count, then per array its dtype, shape and raw bytes. Arrays are written
+with one gather `sendmsg` and read straight into freshly allocated arrays, with
+no serialization step.
+
+Run a DQN learner with `uv run python -m simulation.remote serve`, and workers
+with `uv run python -m simulation.remote work --host <learner host>`.
+"""
+
+import argparse
+import queue
+import socket
+import socketserver
+import struct
+import threading
+from typing import Optional, Union
+
+import numpy as np
+import torch
+from gymnasium import spaces
+from torch import nn
+
+HELLO, TRANSITIONS, WEIGHTS, ACK = range(4)
+
+_MESSAGE = struct.Struct("<BH")  # kind, number of arrays
+_ARRAY = struct.Struct("<3sB")  # dtype string, e.g. b"<f4", number of dimensions
+
+
+def send_arrays(sock: socket.socket, kind: int, *arrays: np.ndarray) -> None:
+    """Send a message of `kind` made of `arrays`."""
+    buffers: list[Union[bytes, memoryview]] = [_MESSAGE.pack(kind, len(arrays))]
+    for array in arrays:
+        array = np.require(array, requirements="C")
+        dtype = array.dtype.str.encode()
+        assert len(dtype) == 3, f"Unsupported dtype {array.dtype}"
+        buffers.append(
+            _ARRAY.pack(dtype, array.ndim)
+            + struct.pack(f"<{array.ndim}Q", *array.shape)
+        )
+        if array.nbytes:
+            buffers.append(array.data)
+
+    views = [memoryview(buffer).cast("B") for buffer in buffers]
+    while views:
+        sent = sock.sendmsg(views)
+        while views and sent >= len(views[0]):
+            sent -= len(views[0])
+            views.pop(0)
+        if views:
+            views[0] = views[0][sent:]
+
+
+def _read_exactly(reader, size: int) -> bytes:
+    data = reader.read(size)
+    if len(data) < size:
+        raise ConnectionError("Connection closed")
+    return data
+
+
+def recv_arrays(reader) -> tuple[int, list[np.ndarray]]:
+    """Receive a message sent with `send_arrays` from `socket.makefile("rb")`.
+
+    Returns:
+        The kind of the message and its arrays
+    """
+    kind, num_arrays = _MESSAGE.unpack(_read_exactly(reader, _MESSAGE.size))
+    arrays = []
+    for _ in range(num_arrays):
+        dtype, ndim = _ARRAY.unpack(_read_exactly(reader, _ARRAY.size))
+        shape = struct.unpack(f"<{ndim}Q", _read_exactly(reader, 8 * ndim))
+        array = np.empty(shape, dtype=np.dtype(dtype.decode()))
+        if array.nbytes and reader.readinto(array.data.cast("B")) < array.nbytes:
+            raise ConnectionError("Connection closed")
+        arrays.append(array)
+    return kind, arrays
+
+
+def make_policy(observation_space, action_space) -> nn.Module:
+    """The network acting in an env: a `QNet` for discrete actions, a
+    `PolicyNetwork` for continuous ones."""
+    if hasattr(action_space, "n"):
+        from simulation.dqn import QNet
+
+        return QNet(int(action_space.n))
+
+    from simulation.cartpole import PolicyNetwork
+
+    return PolicyNetwork(observation_space.shape[0], action_space.shape[0])
+
+
+def parameters_to_array(module: nn.Module) -> np.ndarray:
+    return np.concatenate(
+        [param.detach().numpy().ravel() for param in module.parameters()]
+    )
+
+
+def array_to_parameters(vector: np.ndarray, module: nn.Module) -> None:
+    # In place, so that inference views of the parameters stay valid
+    offset = 0
+    with torch.no_grad():
+        for param in module.parameters():
+            n = param.numel()
+            param.view(-1).copy_(torch.from_numpy(vector[offset : offset + n]))
+            offset += n
+
+
+class _RolloutHandler(socketserver.BaseRequestHandler):
+    server: "RolloutServer"
+
+    def handle(self):
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        reader = self.request.makefile("rb")
+        while True:
+            try:
+                kind, arrays = recv_arrays(reader)
+            except ConnectionError:
+                return
+
+            version = -1
+            if kind == TRANSITIONS:
+                version = int(arrays[0])
+                # Blocks while the learner is behind, which throttles the workers
+                while not self.server.stopped.is_set():
+                    try:
+                        self.server.transitions.put(arrays[1:], timeout=0.1)
+                        break
+                    except queue.Full:
+                        pass
+                else:
+                    return
+                with self.server.lock:
+                    self.server.received[self.client_address] += len(arrays[1])
+
+            weights = self.server.weights_since(version)
+            if weights is None:
+                send_arrays(self.request, ACK)
+            else:
+                send_arrays(self.request, WEIGHTS, np.array(weights[0]), weights[1])
+
+
+class RolloutServer(socketserver.ThreadingTCPServer):
+    """Receives transitions from `RolloutWorker`s and pushes weights back to them.
+
+    Each worker connection is served by its own thread, which puts the received
+    `(states, actions, rewards, next_states, terminated)` batches on the bounded
+    `transitions` queue. `received` counts the transitions per worker address.
+
+    Args:
+        address: `(host, port)` to listen on, port 0 picks a free one
+        module: The policy, whose weights are published right away
+        max_queued_batches: Batches received but not yet taken by the learner
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, module: nn.Module, max_queued_batches: int = 64):
+        super().__init__(address, _RolloutHandler)
+        self.transitions: queue.Queue = queue.Queue(max_queued_batches)
+        self.received: dict = {}
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self._connections: list[socket.socket] = []
+
+        self.version = 0
+        self.weights = parameters_to_array(module)
+        self._thread: Optional[threading.Thread] = None
+
+    def publish(self, module: nn.Module) -> None:
+        """Make the current weights of `module` the next version."""
+        weights = parameters_to_array(module)
+        with self.lock:
+            self.weights = weights
+            self.version += 1
+
+    def weights_since(self, version: int) -> Optional[tuple[int, np.ndarray]]:
+        with self.lock:
+            if version == self.version:
+                return None
+            return self.version, self.weights
+
+    def process_request(self, request, client_address):
+        with self.lock:
+            self.received[client_address] = 0
+            self._connections.append(request)
+        super().process_request(request, client_address)
+
+    def start(self) -> None:
+        """Serve in a background thread."""
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop serving and disconnect the workers, which makes them return."""
+        self.stopped.set()
+        self.shutdown()
+        self.server_close()
+        with self.lock:
+            for connection in self._connections:
+                try:
+                    connection.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass  # already closed by the worker
+
+
+class RolloutWorker:
+    """Steps `num_envs` copies of `env_id` and sends every `steps_per_batch`
+    vector steps of transitions to the `RolloutServer` at `address`.
+
+    Discrete actions are epsilon-greedy on the `QNet`, continuous actions are
+    sampled from the `PolicyNetwork` and clipped to the action space.
+
+    The custom vector envs of this repo, e.g. `CartPole-v99`, reset a done env
+    on the next step, whose transition is dropped. Gymnasium's vector envs reset
+    it in the same step and return the reset observation, so the final one is
+    taken from `info["final_observation"]` instead.
+    """
+
+    def __init__(
+        self,
+        address: tuple[str, int],
+        env_id: str = "CartPole-v99",
+        num_envs: int = 16,
+        steps_per_batch: int = 64,
+        epsilon: float = 0.1,
+        seed: int = 0,
+    ):
+        import gymnasium as gym
+
+        import simulation.envs  # noqa: F401 (registers CartPole-v99)
+
+        self.address = address
+        self.steps_per_batch = steps_per_batch
+        self.epsilon = epsilon
+        self.rng = np.random.default_rng(seed)
+        self.seed = seed
+
+        spec = gym.spec(env_id)
+        self.same_step_reset = not spec.vector_entry_point
+        self.env = gym.make_vec(
+            env_id,
+            num_envs=num_envs,
+            vectorization_mode="sync" if self.same_step_reset else "custom",
+        )
+        self.num_envs = num_envs
+        self.discrete = isinstance(self.env.single_action_space, spaces.Discrete)
+        self.policy = make_policy(
+            self.env.single_observation_space, self.env.single_action_space
+        )
+        self.inference = self.policy.inference(num_envs)
+        self.version = -1
+
+        obs_shape = self.env.single_observation_space.shape
+        action_shape = self.env.single_action_space.shape
+        assert obs_shape is not None and action_shape is not None
+        shape = (steps_per_batch, num_envs)
+        self.states = np.empty((*shape, *obs_shape), dtype=np.float32)
+        self.actions = np.empty(
+            (*shape, *action_shape), dtype=np.int64 if self.discrete else np.float32
+        )
+        self.rewards = np.empty(shape, dtype=np.float32)
+        self.next_states = np.empty_like(self.states)
+        self.terminated = np.empty(shape, dtype=np.bool_)
+        self.valid = np.empty(shape, dtype=np.bool_)
+
+    def act(self, obs: np.ndarray) -> np.ndarray:
+        space = self.env.single_action_space
+        if isinstance(space, spaces.Discrete):
+            actions = self.inference(obs).argmax(1)
+            explore = self.rng.random(len(actions)) < self.epsilon
+            actions[explore] = self.rng.integers(
+                int(space.n), size=np.count_nonzero(explore)
+            )
+            return actions
+
+        assert isinstance(space, spaces.Box)
+        means, stddevs = self.inference(obs)
+        return np.clip(self.rng.normal(means, stddevs), space.low, space.high)
+
+    def _receive_weights(self, reader) -> None:
+        kind, arrays = recv_arrays(reader)
+        if kind == WEIGHTS:
+            self.version = int(arrays[0])
+            array_to_parameters(arrays[1], self.policy)
+
+    def run(self, num_batches: Optional[int] = None) -> None:
+        """Send `num_batches` batches, or until the server goes away."""
+        with socket.create_connection(self.address) as sock:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            reader = sock.makefile("rb")
+            send_arrays(sock, HELLO)
+            self._receive_weights(reader)
+
+            obs, _ = self.env.reset(seed=self.seed)
+            was_done = np.zeros(self.num_envs, dtype=np.bool_)
+            batch = 0
+            while num_batches is None or batch < num_batches:
+                for t in range(self.steps_per_batch):
+                    actions = self.act(obs)
+                    next_obs, rewards, terminated, truncated, info = self.env.step(
+                        actions
+                    )
+
+                    self.states[t] = obs
+                    self.actions[t] = actions
+                    self.rewards[t] = rewards
+                    self.next_states[t] = next_obs
+                    self.terminated[t] = terminated
+                    if self.same_step_reset:
+                        # `next_obs` of a done env is already the reset observation
+                        for i in np.flatnonzero(info.get("_final_observation", ())):
+                            self.next_states[t, i] = info["final_observation"][i]
+                        self.valid[t] = True
+                    else:
+                        # The step after a done one only resets the env
+                        np.logical_not(was_done, out=self.valid[t])
+                        was_done = terminated | truncated
+
+                    obs = next_obs
+
+                valid = self.valid
+                try:
+                    send_arrays(
+                        sock,
+                        TRANSITIONS,
+                        np.array(self.version),
+                        self.states[valid],
+                        self.actions[valid],
+                        self.rewards[valid],
+                        self.next_states[valid],
+                        self.terminated[valid],
+                    )
+                    self._receive_weights(reader)
+                except (ConnectionError, OSError):
+                    break
+                batch += 1
+
+        self.env.close()
+
+
+def serve(
+    address: tuple[str, int] = ("0.0.0.0", 7010),
+    num_updates: int = 100_000,
+    publish_interval: int = 100,
+    sync_interval: int = 500,
+) -> None:
+    """DQN learner on CartPole-v99 that trains on transitions from remote workers."""
+    from simulation.dqn import DQNAgent
+
+    agent = DQNAgent()
+    server = RolloutServer(address, agent.qnet)
+    server.start()
+    print("listening on {}:{}".format(*server.server_address))
+
+    try:
+        update = 0
+        while update < num_updates:
+            # Add whatever arrived since the last step, waiting only for a first batch
+            while True:
+                try:
+                    batch = server.transitions.get(
+                        block=len(agent.replay_buffer) < agent.batch_size
+                    )
+                except queue.Empty:
+                    break
+                agent.replay_buffer.add_batch(*batch)
+
+            agent.learn()
+            update += 1
+            if update % publish_interval == 0:
+                server.publish(agent.qnet)
+            if update % sync_interval == 0:
+                agent.sync_qnet()
+            if update % 1000 == 0:
+                print(f"update: {update}, transitions: {sum(server.received.values())}")
+    finally:
+        server.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("mode", choices=["serve", "work"])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=7010)
+    parser.add_argument("--env", default="CartPole-v99")
+    parser.add_argument("--num-envs", type=int, default=16)
+    args = parser.parse_args()
+
+    if args.mode == "serve":
+        serve((args.host, args.port))
+    else:
+        RolloutWorker((args.host, args.port), args.env, args.num_envs).run()
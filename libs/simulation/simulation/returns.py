@@ -0,0 +1,312 @@
+"""Return and advantage kernels for batched rollouts, in NumPy and torch.
+
+All kernels take `(T, N)` arrays of `N` envs stepped together for `T` steps,
+either as NumPy arrays or as torch tensors, and return the same type. Envs are
+expected to autoreset, so one column can hold several episodes:
+
+- `terminated[t]` ends an episode with no value after it,
+- `truncated[t]` ends an episode that would have gone on, so it is
+  bootstrapped from `next_values[t]`, the value of the final observation,
+- the last step of the rollout is bootstrapped from `next_values[T - 1]` as
+  well, unless it terminated.
+
+Without `next_values` nothing is bootstrapped, which is the Monte Carlo return
+of complete episodes. Discounted returns and GAE are linear recurrences
+`x[t] = b[t] + a[t] * x[t + 1]`, evaluated for few envs with a parallel scan in
+`log2(T)` vectorized steps rather than `T` Python iterations.
+"""
+
+from typing import Optional, TypeVar
+
+import numpy as np
+import torch
+
+Array = TypeVar("Array", np.ndarray, torch.Tensor)
+
+
+def _zeros_like(x: Array) -> Array:
+    if isinstance(x, torch.Tensor):
+        return torch.zeros_like(x)
+    return np.zeros_like(x)
+
+
+def _empty_like(x: Array) -> Array:
+    if isinstance(x, torch.Tensor):
+        return torch.empty_like(x)
+    return np.empty_like(x)
+
+
+def _copy(x: Array) -> Array:
+    if isinstance(x, torch.Tensor):
+        return x.clone()
+    return x.copy()
+
+
+def _as_float(x: Array) -> Array:
+    if isinstance(x, torch.Tensor):
+        return x if x.is_floating_point() else x.double()
+    x = np.asarray(x)
+    return x if np.issubdtype(x.dtype, np.floating) else x.astype(np.float64)
+
+
+def _flags(flags: Optional[Array], like: Array) -> Array:
+    if flags is None:
+        return _zeros_like(like) != 0
+    if isinstance(like, torch.Tensor):
+        return flags.bool()
+    return np.asarray(flags, dtype=np.bool_)
+
+
+def _float(flags: Array, like: Array) -> Array:
+    """`flags` as 0/1 in the dtype of `like`, so that scaling them keeps its
+    precision (torch would pick float32 for a bool tensor times a float)."""
+    if isinstance(flags, torch.Tensor):
+        return flags.to(like.dtype)
+    return flags.astype(like.dtype)
+
+
+def _width(x: Array) -> int:
+    """Number of elements per time step."""
+    return int(np.prod(x.shape[1:]))
+
+
+# Below this many envs the parallel scan wins, above it the `log2(T)` times
+# larger amount of work of the scan costs more than the `T` Python iterations,
+# and the kernels run one fused backward pass over their inputs instead
+SCAN_MAX_WIDTH = 256
+
+
+def reverse_linear_recurrence(a: Array, b: Array) -> Array:
+    """Solve `x[t] = b[t] + a[t] * x[t + 1]` backwards from `x[T] = 0`.
+
+    Narrow inputs use a Hillis-Steele scan: after the step with `offset`, `x[t]`
+    is expressed in terms of `x[t + 2 * offset]`, so `log2(T)` vectorized steps
+    reach the end. Inputs with `SCAN_MAX_WIDTH` or more elements per step use
+    one vectorized step per time step instead.
+
+    Args:
+        a: Coefficients of shape `(T, ...)`
+        b: Offsets of the same shape
+
+    Returns:
+        `x` of shape `(T, ...)`
+    """
+    b = _copy(b)
+    length = len(b)
+
+    if _width(b) >= SCAN_MAX_WIDTH:
+        for t in range(length - 2, -1, -1):
+            b[t] += a[t] * b[t + 1]
+        return b
+
+    a = _copy(a)
+    offset = 1
+    while offset < length:
+        # Both right-hand sides are evaluated before assigning, from the old values
+        b[: length - offset] = b[: length - offset] + a[: length - offset] * b[offset:]
+        a[: length - offset] = a[: length - offset] * a[offset:]
+        offset *= 2
+    return b
+
+
+def discounted_returns(
+    rewards: Array,
+    gamma: float,
+    terminated: Optional[Array] = None,
+    truncated: Optional[Array] = None,
+    next_values: Optional[Array] = None,
+) -> Array:
+    """Discounted return from every step.
+
+    Args:
+        rewards: Rewards of shape `(T, ...)`
+        gamma: Discount factor
+        terminated: Whether each step terminated its episode
+        truncated: Whether each step truncated its episode
+        next_values: Value of the observation after each step, to bootstrap
+            truncated episodes and the end of the rollout
+
+    Returns:
+        The returns, of the same shape as `rewards`
+    """
+    rewards = _as_float(rewards)
+    if _width(rewards) >= SCAN_MAX_WIDTH:
+        return _discounted_returns_loop(
+            rewards, gamma, terminated, truncated, next_values
+        )
+
+    terminated = _flags(terminated, rewards)
+    done = terminated | _flags(truncated, rewards)
+
+    # The rollout ends after its last step, so that step is bootstrapped too
+    cut = _copy(done)
+    cut[-1] = True
+    b = rewards
+    if next_values is not None:
+        b = rewards + gamma * _float(cut & ~terminated, rewards) * next_values
+    return reverse_linear_recurrence(gamma * _float(~cut, rewards), b)
+
+
+def _discounted_returns_loop(
+    rewards: Array,
+    gamma: float,
+    terminated: Optional[Array],
+    truncated: Optional[Array],
+    next_values: Optional[Array],
+) -> Array:
+    """`discounted_returns` as one backward pass, reading every input once and
+    updating each row of the output in place."""
+    if terminated is not None:
+        terminated = _flags(terminated, rewards)
+    if truncated is not None:
+        truncated = _flags(truncated, rewards)
+
+    returns = _empty_like(rewards)
+    last = len(rewards) - 1
+    for t in range(last, -1, -1):
+        # The value after the step: the bootstrap at the end of the rollout or of
+        # a truncated episode, the return of the next step otherwise
+        row = returns[t]
+        if t == last:
+            row[...] = 0.0 if next_values is None else next_values[t]
+        else:
+            row[...] = returns[t + 1]
+            if truncated is not None:
+                cut = truncated[t]
+                row[cut] = 0.0 if next_values is None else next_values[t][cut]
+        if terminated is not None:
+            row[terminated[t]] = 0.0
+        row *= gamma
+        row += rewards[t]
+    return returns
+
+
+def gae(
+    rewards: Array,
+    values: Array,
+    next_values: Array,
+    gamma: float,
+    lam: float,
+    terminated: Optional[Array] = None,
+    truncated: Optional[Array] = None,
+) -> tuple[Array, Array]:
+    """Generalized advantage estimation (Schulman et al., 2016).
+
+    Args:
+        rewards: Rewards of shape `(T, ...)`
+        values: Value of the observation before each step
+        next_values: Value of the observation after each step. After a done
+            step it is the value of the final observation, not of the reset one.
+        gamma: Discount factor
+        lam: GAE lambda, 0 for one-step TD errors and 1 for Monte Carlo
+        terminated: Whether each step terminated its episode
+        truncated: Whether each step truncated its episode
+
+    Returns:
+        The advantages, and the returns `advantages + values` as value targets
+    """
+    rewards = _as_float(rewards)
+    if _width(rewards) >= SCAN_MAX_WIDTH:
+        advantages = _gae_loop(
+            rewards, values, next_values, gamma, lam, terminated, truncated
+        )
+        return advantages, advantages + values
+
+    terminated = _flags(terminated, rewards)
+    done = terminated | _flags(truncated, rewards)
+
+    deltas = rewards + gamma * _float(~terminated, rewards) * next_values - values
+    advantages = reverse_linear_recurrence(gamma * lam * _float(~done, rewards), deltas)
+    return advantages, advantages + values
+
+
+def _gae_loop(
+    rewards: Array,
+    values: Array,
+    next_values: Array,
+    gamma: float,
+    lam: float,
+    terminated: Optional[Array],
+    truncated: Optional[Array],
+) -> Array:
+    """The advantages of `gae` as one backward pass, reading every input once
+    and updating each row of the output in place."""
+    if terminated is not None:
+        terminated = _flags(terminated, rewards)
+    if truncated is not None:
+        truncated = _flags(truncated, rewards)
+
+    advantages = _empty_like(rewards)
+    last = len(rewards) - 1
+    for t in range(last, -1, -1):
+        # `r + gamma * (lam * advantage after + next value) - value`, where the
+        # advantage after a done step and the next value after a terminated
+        # step are zero
+        row = advantages[t]
+        if t == last:
+            row[...] = next_values[t]
+        else:
+            row[...] = advantages[t + 1]
+            row *= lam
+            if truncated is not None:
+                row[truncated[t]] = 0.0
+            row += next_values[t]
+        if terminated is not None:
+            row[terminated[t]] = 0.0
+        row *= gamma
+        row += rewards[t]
+        row -= values[t]
+    return advantages
+
+
+def nstep_targets(
+    rewards: Array,
+    next_values: Array,
+    gamma: float,
+    n: int,
+    terminated: Optional[Array] = None,
+    truncated: Optional[Array] = None,
+) -> Array:
+    """n-step bootstrapped targets
+    `r[t] + ... + gamma^(m-1) r[t+m-1] + gamma^m next_values[t+m-1]`.
+
+    The window `m <= n` stops early at the end of an episode or of the rollout,
+    and is not bootstrapped when the episode terminated.
+
+    Args:
+        rewards: Rewards of shape `(T, ...)`
+        next_values: Value of the observation after each step, e.g. the max
+            target Q-value for DQN
+        gamma: Discount factor
+        n: Number of steps, 1 gives the one-step TD target
+        terminated: Whether each step terminated its episode
+        truncated: Whether each step truncated its episode
+
+    Returns:
+        The targets, of the same shape as `rewards`
+    """
+    rewards = _as_float(rewards)
+    terminated = _flags(terminated, rewards)
+    done = terminated | _flags(truncated, rewards)
+    length = len(rewards)
+
+    targets = _zeros_like(rewards)
+    discount = 1.0
+    active = _zeros_like(rewards) == 0
+    # Windows of rollouts shorter than `n` all end at the end of the rollout
+    num_steps = min(n, length)
+    for k in range(num_steps):
+        # Step t + k of the window of every t < length - k
+        rows = slice(0, length - k)
+        steps = slice(k, length)
+        targets[rows] += discount * _float(active[rows], rewards) * rewards[steps]
+        discount *= gamma
+
+        stop = _copy(done[steps])
+        stop[-1] = True  # end of the rollout
+        if k == num_steps - 1:
+            stop[:] = True
+        bootstrap = active[rows] & stop & ~terminated[steps]
+        targets[rows] += discount * _float(bootstrap, rewards) * next_values[steps]
+        active[rows] &= ~stop
+    return targets
@@ -0,0 +1,191 @@
+"""Batched open-loop MuJoCo rollouts on the CPU.
+
+`RolloutEngine` takes one compiled model, a batch of initial states and control
+sequences, and returns the `qpos`, `qvel` and sensor trajectories of the batch
+stacked into arrays of shape `(num_rollouts, num_steps, ...)`. The batch is
+split over a fixed set of `MjData`, one per thread. `mujoco.rollout` steps them
+in its C++ thread pool where the installed MuJoCo has it. Otherwise a Python
+thread pool calls `mj_step`, which releases the GIL. Both write into output
+arrays that are allocated once and reused while the batch shape stays the same.
+
+Run with `uv run python -m simulation.benchmarks.rollout`.
+"""
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Optional
+
+import mujoco
+import numpy as np
+
+STATE_SPEC = mujoco.mjtState.mjSTATE_FULLPHYSICS
+CONTROL_SPEC = mujoco.mjtState.mjSTATE_CTRL
+
+
+def get_state(model: mujoco.MjModel, data: mujoco.MjData) -> np.ndarray:
+    """The full physics state of `data`, e.g. to start rollouts from."""
+    state = np.empty(mujoco.mj_stateSize(model, STATE_SPEC))
+    mujoco.mj_getState(model, data, state, STATE_SPEC)
+    return state
+
+
+@dataclass
+class Trajectories:
+    """States after every step, of shape `(num_rollouts, num_steps, ...)`.
+
+    `qpos` and `qvel` are views into `state`, the full physics state vectors
+    laid out as `time, qpos, qvel, act, ...`.
+    """
+
+    state: np.ndarray
+    sensordata: np.ndarray
+    qpos: np.ndarray
+    qvel: np.ndarray
+
+    @property
+    def time(self) -> np.ndarray:
+        return self.state[..., 0]
+
+
+class RolloutEngine:
+    """Rolls out batches of control sequences of `model` in parallel.
+
+    Args:
+        model: The compiled model
+        num_threads: Threads, and `MjData`, to step rollouts on, the CPU count
+            by default
+        backend: "mujoco" for `mujoco.rollout`, "threads" for the Python thread
+            pool, or None to use `mujoco.rollout` when it is available
+    """
+
+    def __init__(
+        self,
+        model: mujoco.MjModel,
+        num_threads: Optional[int] = None,
+        backend: Optional[str] = None,
+    ):
+        self.model = model
+        self.num_threads = num_threads or os.cpu_count() or 1
+        self.datas = [mujoco.MjData(model) for _ in range(self.num_threads)]
+        self.state_size = mujoco.mj_stateSize(model, STATE_SPEC)
+
+        try:
+            from mujoco import rollout
+        except ImportError:
+            rollout = None
+        if backend is None:
+            backend = "mujoco" if rollout is not None else "threads"
+        if backend not in ("mujoco", "threads"):
+            raise ValueError(f"unknown backend: {backend}")
+        if backend == "mujoco" and rollout is None:
+            raise ValueError("mujoco.rollout is not available in this MuJoCo")
+        self.backend = backend
+
+        self._rollout = None
+        self._executor = None
+        if backend == "mujoco":
+            # A persistent C++ thread pool where supported, else one per call
+            if hasattr(rollout, "Rollout"):
+                self._rollout = rollout.Rollout(nthread=self.num_threads)
+            else:
+                self._rollout = rollout
+        else:
+            self._executor = ThreadPoolExecutor(self.num_threads)
+
+        self._outputs: Optional[Trajectories] = None
+
+    def _allocate(self, num_rollouts: int, num_steps: int) -> Trajectories:
+        outputs = self._outputs
+        if outputs is None or outputs.state.shape[:2] != (num_rollouts, num_steps):
+            state = np.empty((num_rollouts, num_steps, self.state_size))
+            nq, nv = self.model.nq, self.model.nv
+            outputs = Trajectories(
+                state=state,
+                sensordata=np.empty((num_rollouts, num_steps, self.model.nsensordata)),
+                qpos=state[..., 1 : 1 + nq],
+                qvel=state[..., 1 + nq : 1 + nq + nv],
+            )
+            self._outputs = outputs
+        return outputs
+
+    def rollout(self, initial_states: np.ndarray, controls: np.ndarray) -> Trajectories:
+        """Roll out every control sequence from its initial state.
+
+        Args:
+            initial_states: Full physics states from `get_state`, of shape
+                `(num_rollouts, state_size)`, or `(state_size,)` to start all
+                rollouts from the same state
+            controls: `data.ctrl` for every step, of shape
+                `(num_rollouts, num_steps, nu)`
+
+        Returns:
+            The trajectories, in arrays that the next call with the same
+            numbers of rollouts and steps overwrites
+        """
+        controls = np.ascontiguousarray(controls, dtype=np.float64)
+        num_rollouts, num_steps, _ = controls.shape
+        initial_states = np.ascontiguousarray(
+            np.broadcast_to(initial_states, (num_rollouts, self.state_size)),
+            dtype=np.float64,
+        )
+        outputs = self._allocate(num_rollouts, num_steps)
+
+        if self._rollout is not None:
+            self._rollout.rollout(
+                self.model,
+                self.datas,
+                initial_states,
+                controls,
+                control_spec=CONTROL_SPEC.value,
+                state=outputs.state,
+                sensordata=outputs.sensordata,
+            )
+            return outputs
+
+        # Contiguous chunks of rollouts, a few per thread to balance the load
+        chunk_size = max(1, num_rollouts // (self.num_threads * 4))
+        chunks = [
+            range(start, min(start + chunk_size, num_rollouts))
+            for start in range(0, num_rollouts, chunk_size)
+        ]
+        data_pool = list(self.datas)
+
+        def run_chunk(rollouts):
+            data = data_pool.pop()  # list.pop is atomic
+            try:
+                for i in rollouts:
+                    self._rollout_one(data, initial_states[i], controls[i], outputs, i)
+            finally:
+                data_pool.append(data)
+
+        assert self._executor is not None, "the engine is closed"
+        # Consume the iterator so that exceptions of the tasks are raised
+        list(self._executor.map(run_chunk, chunks))
+        return outputs
+
+    def _rollout_one(self, data, initial_state, controls, outputs, i):
+        model = self.model
+        # Also clears the warmstart and the rest of the previous rollout
+        mujoco.mj_resetData(model, data)
+        mujoco.mj_setState(model, data, initial_state, STATE_SPEC)
+        state, sensordata = outputs.state[i], outputs.sensordata[i]
+        for t in range(len(controls)):
+            data.ctrl[:] = controls[t]
+            mujoco.mj_step(model, data)
+            mujoco.mj_getState(model, data, state[t], STATE_SPEC)
+            sensordata[t] = data.sensordata
+
+    def close(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+        if self._rollout is not None and hasattr(self._rollout, "close"):
+            self._rollout.close()
+        self._rollout = None
+
+    def __enter__(self) -> "RolloutEngine":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()